@@ -0,0 +1,155 @@
+"""Latency, throughput and memory of complete scrape cycles, fully offline.
+
+Runs process_scraper for every source in sources.json against the replay
+server (bench/fixtures or recordings made with RECORD_DIR) and the fake
+webhook: fetch -> parse -> diff against the seen store -> notify, until every
+notification of the cycle is delivered. Each cycle publishes a few new
+listings; the first cycle, which finds everything new, is a warm-up and not
+measured. With --max-p99-ms the exit status is 1 when p99 cycle latency is
+above the threshold, so CI can catch regressions.
+
+    python -m bench.bench_cycle --cycles 20 --items 600 --new-per-cycle 5
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.fake_webhook import start_fake_webhook
+from bench.replay_server import start_replay_server, parse_fixture_args
+from changes import ChangeTracker
+from dwellings import DwellingIndex
+from fetcher import FETCH_SECONDS, JSON_DECODE_SECONDS
+from filters import apply_subscriptions
+from history import ListingHistory
+from http_session import create_session
+from notifier import NotificationDispatcher, NOTIFY_SECONDS
+from pages import PARSE_SECONDS
+from router import Router
+from scraper import process_scraper, DIFF_SECONDS
+from seen_store import SeenStore
+from sources import load_sources
+
+SOURCES_PATH = os.path.join(os.path.dirname(__file__), '..', 'sources.json')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def mean_ms(histogram):
+    """Mean of a timer histogram over all its labels, in milliseconds."""
+    children = histogram.snapshot().values()
+    count = sum(child['count'] for child in children)
+    return sum(child['sum'] for child in children) / count * 1000 if count else 0.0
+
+
+async def run_cycle(session, router, sources, trackers, history, dwellings):
+    """One cycle of every source, including delivery of its notifications."""
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        process_scraper(session, router, key, source, trackers[key].store, tracker=trackers[key], history=history,
+                        dwellings=dwellings)
+        for key, source in sources.items()
+    ))
+    await router.dispatcher.join()
+    return time.perf_counter() - start, sum(r['listings'] for r in results), sum(r['new'] for r in results)
+
+
+async def run(args, workdir):
+    replay_runner, replay, api_base = await start_replay_server(
+        parse_fixture_args(args.fixture), total_items=args.items, latency=args.api_latency
+    )
+    webhook_runner, webhook, webhook_base = await start_fake_webhook(limit=1000, window=1.0)
+
+    sources = load_sources(SOURCES_PATH)
+    sources = {key: source for key, source in sources.items() if key in replay.sources}
+    for key, source in sources.items():
+        source['api_url'] = f"{api_base}/{key}/api/v1/actueel-aanbod"
+        source['webhook_url'] = f"{webhook_base}/webhooks/{key}/token"
+    apply_subscriptions(sources, [])
+    trackers = {
+        key: ChangeTracker(SeenStore(os.path.join(workdir, f"seen_{key}.log")).load()) for key in sources
+    }
+    history = ListingHistory(os.path.join(workdir, 'history.db')) if args.history else None
+
+    timings = []
+    listings = new = 0
+    try:
+        async with create_session() as session:
+            dispatcher = NotificationDispatcher(session)
+            router = Router(dispatcher)
+            dwellings = None
+            if args.dwellings:
+                dwellings = DwellingIndex(router.sending)
+                for key, source in sources.items():
+                    dwellings.attach(key, source, trackers[key].store)
+            await run_cycle(session, router, sources, trackers, history, dwellings)
+            for _ in range(args.cycles):
+                for source in replay.sources.values():
+                    source.add_new(args.new_per_cycle)
+                elapsed, cycle_listings, cycle_new = await run_cycle(
+                    session, router, sources, trackers, history, dwellings
+                )
+                timings.append(elapsed)
+                listings += cycle_listings
+                new += cycle_new
+            await dispatcher.close()
+    finally:
+        for tracker in trackers.values():
+            tracker.store.close()
+        if history:
+            history.close()
+        await webhook_runner.cleanup()
+        await replay_runner.cleanup()
+
+    return timings, listings, new, replay.requests, webhook.embeds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=20, help='measured cycles (after one warm-up)')
+    parser.add_argument('--items', type=int, default=600, help='listings per replayed source')
+    parser.add_argument('--new-per-cycle', type=int, default=5, help='new listings published per source per cycle')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='replay server latency per page (s)')
+    parser.add_argument('--fixture', action='append', metavar='NAME=PATH',
+                        help='fixture file or recording directory per source (default: bench/fixtures)')
+    parser.add_argument('--history', action='store_true', help='also record listings in a history database')
+    parser.add_argument('--dwellings', action='store_true', help='also cluster new listings across sources by address')
+    parser.add_argument('--trace-memory', action='store_true', help='report the Python heap peak (slower)')
+    parser.add_argument('--max-p99-ms', type=float, default=None, help='fail if p99 cycle latency exceeds this')
+    args = parser.parse_args()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        timings, listings, new, requests, embeds = asyncio.run(run(args, workdir))
+
+    total = sum(timings)
+    p50, p99 = percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000
+    print(f"{args.cycles} cycles, {args.items} listings per source, {args.new_per_cycle} new per source per cycle, "
+          f"{args.api_latency * 1000:.0f} ms API latency")
+    print(f"  cycle latency  p50 {p50:8.1f} ms   p99 {p99:8.1f} ms   max {max(timings) * 1000:8.1f} ms")
+    print(f"  throughput     {listings / total:10,.0f} listings/s   {new} new, {embeds} embeds delivered, "
+          f"{requests} API requests")
+    # ru_maxrss is in KiB on Linux
+    memory = f"  memory         max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB"
+    if args.trace_memory:
+        memory += f"   Python heap peak {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MiB"
+    print(memory)
+    print(f"  per stage      fetch {mean_ms(FETCH_SECONDS):.2f}  decode {mean_ms(JSON_DECODE_SECONDS):.2f}  "
+          f"parse {mean_ms(PARSE_SECONDS):.2f}  diff {mean_ms(DIFF_SECONDS):.2f} ms/page   "
+          f"notify {mean_ms(NOTIFY_SECONDS):.2f} ms/message (incl. warm-up)")
+
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        print(f"❌ p99 cycle latency {p99:.1f} ms is above {args.max_p99_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Throughput of the notification dispatcher for a burst of new listings.
+
+Sends a burst of embeds through NotificationDispatcher to the local fake
+webhook and compares it with posting one message per listing serially, the
+way notifications were sent before the dispatcher existed. With
+--thumbnails, every embed also has an image, served by a local image server,
+that is attached as a thumbnail (needs Pillow).
+
+    python -m bench.bench_notify --listings 100
+    python -m bench.bench_notify --listings 100 --thumbnails --image-latency 0.3
+"""
+import argparse
+import asyncio
+import io
+import random
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+from bench.fake_webhook import start_fake_webhook
+from http_session import create_session
+from notifier import NotificationDispatcher, DISPATCH_STATS
+import thumbnails
+
+
+def make_embed(i, image_base=None):
+    embed = {
+        'title': '🏢 New Plaza Listing!',
+        'description': f"**Teststraat {i}, 7511 AB Enschede**",
+        'url': f"https://plaza.newnewnew.space/en/availables-places/living-place/details/{i}",
+        'color': 0x3498db,
+        'fields': [
+            {'name': 'Price', 'value': f"€{500 + i}.00", 'inline': True},
+            {'name': 'Area', 'value': '24 m²', 'inline': True},
+            {'name': 'Property Type', 'value': 'Studio', 'inline': True}
+        ],
+        'footer': {'text': 'Plaza • 2025-05-31 12:00:00'}
+    }
+    if image_base:
+        embed['image'] = {'url': f"{image_base}/images/{i}.jpg"}
+    return embed
+
+
+def make_image(seed, size=(1280, 960)):
+    """A photo-sized JPEG that doesn't compress away (so every listing has a distinct image)."""
+    image = thumbnails.Image.effect_noise(size, 40 + seed % 20).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=85)
+    return output.getvalue()
+
+
+async def start_image_server(count, latency):
+    """Serve /images/<n>.jpg for n < count after `latency` seconds. Returns (runner, base_url)."""
+    images = [make_image(i) for i in range(count)]
+
+    async def handle(request):
+        await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+        return web.Response(body=images[int(request.match_info['n'])], content_type='image/jpeg')
+
+    app = web.Application()
+    app.router.add_get('/images/{n}.jpg', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def bench_serial(session, url, count):
+    start = time.perf_counter()
+    for i in range(count):
+        while True:
+            async with session.post(url, json={'embeds': [make_embed(i)]}) as response:
+                if response.status != 429:
+                    break
+                await asyncio.sleep((await response.json())['retry_after'])
+    return time.perf_counter() - start
+
+
+async def bench_dispatcher(session, url, count, thumbnailer=None, image_base=None):
+    dispatcher = NotificationDispatcher(session, thumbnailer=thumbnailer)
+    delivered = []
+    start = time.perf_counter()
+    for i in range(count):
+        dispatcher.submit(url, i, make_embed(i, image_base), on_delivered=lambda i=i: delivered.append(i))
+    await dispatcher.join()
+    elapsed = time.perf_counter() - start
+    await dispatcher.close()
+    assert len(delivered) == count, f"only {len(delivered)}/{count} delivered"
+    return elapsed
+
+
+async def run(args, workdir):
+    runner, state, base_url = await start_fake_webhook(
+        limit=args.limit, window=args.window, latency=args.latency
+    )
+    image_runner = None
+    try:
+        async with create_session() as session:
+            benches = [('serial, 1 embed/message', bench_serial), ('dispatcher', bench_dispatcher)]
+            if args.thumbnails:
+                image_runner, image_base = await start_image_server(args.listings, args.image_latency)
+                cache = thumbnails.ThumbnailCache(workdir, 50 * 1024 * 1024)
+                thumbnailer = thumbnails.Thumbnailer(session, cache, concurrency=args.image_concurrency)
+                benches.append(('dispatcher + thumbnails', lambda session, url, count: bench_dispatcher(
+                    session, url, count, thumbnailer, image_base)))
+            results = []
+            for name, bench in benches:
+                url = f"{base_url}/webhooks/{name.split(',')[0].replace(' ', '')}/token"
+                messages, rate_limited = state.messages, state.rate_limited
+                elapsed = await bench(session, url, args.listings)
+                results.append((name, elapsed, state.messages - messages, state.rate_limited - rate_limited))
+            if args.thumbnails:
+                await thumbnailer.close()
+    finally:
+        if image_runner:
+            await image_runner.cleanup()
+        await runner.cleanup()
+
+    print(f"Burst of {args.listings} listings, fake webhook limit {args.limit} per {args.window}s, "
+          f"{args.latency * 1000:.0f} ms latency")
+    for name, elapsed, messages, rate_limited in results:
+        print(f"  {name:<24} {elapsed:7.2f} s  {args.listings / elapsed:8.1f} listings/s  "
+              f"{messages:4d} messages  {rate_limited:3d} x 429")
+    if args.thumbnails:
+        print(f"  {state.attachments} thumbnails attached, {DISPATCH_STATS['thumbnails_late']} too late "
+              f"({args.image_latency * 1000:.0f} ms image latency, {args.image_concurrency} downloads at a time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--listings', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=5, help='fake webhook requests per window')
+    parser.add_argument('--window', type=float, default=2.0, help='fake webhook rate-limit window (s)')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake webhook response latency (s)')
+    parser.add_argument('--thumbnails', action='store_true', help='also attach thumbnails of listing images')
+    parser.add_argument('--image-latency', type=float, default=0.2, help='image server latency (s)')
+    parser.add_argument('--image-concurrency', type=int, default=4, help='images downloaded at the same time')
+    args = parser.parse_args()
+    if args.thumbnails and not thumbnails.available():
+        sys.exit("--thumbnails needs Pillow: pip install Pillow")
+    with tempfile.TemporaryDirectory() as workdir:
+        asyncio.run(run(args, workdir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Items/second of the listing normalization, old dict path vs. compiled Listing path.
+
+The fixture responses in bench/fixtures are expanded to a few thousand items
+(unique IDs, house numbers and prices) per source before timing.
+
+    python -m bench.bench_parse --items 5000
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import time
+
+from sources import load_sources
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def _lookup(item, path):
+    value = item
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+    return value
+
+
+def resolve_field(item, paths):
+    for path in paths:
+        value = _lookup(item, path)
+        if value not in (None, '') and not isinstance(value, (dict, list)):
+            return value
+    return ''
+
+
+def legacy_parse_item(source, item):
+    """The per-item parser before compiled extractors, kept as the baseline."""
+    fields = {name: resolve_field(item, paths) for name, paths in source['fields'].items()}
+    for name in ('street', 'house_number', 'house_number_addition', 'city', 'postal_code'):
+        fields.setdefault(name, '')
+
+    listing_id = str(item.get('id', ''))
+    title_parts = [str(p) for p in [fields['street'], fields['house_number'], fields['house_number_addition']] if p]
+    title = ' '.join(title_parts)
+    if fields['postal_code'] or fields['city']:
+        title += f", {fields['postal_code']} {fields['city']}".strip()
+    if not title or title.isspace():
+        return None
+
+    rent = fields.pop('rent', '')
+    area = fields.pop('area', '')
+    img_url = str(fields.pop('image', ''))
+    if img_url and not img_url.startswith(('http://', 'https://')):
+        img_url = f"{source['base_url']}{img_url}"
+
+    listing = dict(fields)
+    listing.update({
+        'id': listing_id,
+        'title': title,
+        'price': f"€{float(rent):.2f}" if rent else 'No price info',
+        'area': f"{area} m²" if area else 'No area info',
+        'img_url': img_url,
+        'timestamp': time.time(),
+        'source': source['key']
+    })
+
+    if source['link']['path'] == 'title_slug':
+        slug = re.sub(r'[^a-z0-9]', '-', title.lower())
+        slug = re.sub(r'-+', '-', slug).strip('-')
+        path = f"{listing_id}-{slug}" if slug else listing_id
+    else:
+        components = [listing_id]
+        for part in (fields['street'].lower().replace(" ", ""), fields['house_number'],
+                     str(fields['house_number_addition']).strip().replace(" ", ""),
+                     fields['city'].lower().replace(" ", "")):
+            if part:
+                components.append(str(part))
+        path = "-".join(components)
+    listing['link'] = source['link']['template'].format(path=path)
+    return listing
+
+
+def load_items(source_key, count):
+    """Expand the fixture response of a source to `count` distinct items."""
+    with open(os.path.join(FIXTURE_DIR, f"aanbod_{source_key}.json"), 'r', encoding='utf-8') as f:
+        templates = json.load(f)['data']
+    items = []
+    for i in range(count):
+        item = copy.deepcopy(templates[i % len(templates)])
+        item['id'] = 100000 + i
+        item['houseNumber'] = str(1 + i % 250)
+        if item.get('totalRent'):
+            item['totalRent'] = round(item['totalRent'] + i % 97, 2)
+        items.append(item)
+    return items
+
+
+def measure(parse, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            parse(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000, help='items per source')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sources = load_sources(os.path.join(os.path.dirname(__file__), '..', 'sources.json'))
+    print(f"{args.items} items per source, best of {args.repeat}")
+    for key, source in sources.items():
+        items = load_items(key, args.items)
+        timestamp = time.time()
+        compiled = source['parser']
+        old_rate = measure(lambda item: legacy_parse_item(source, item), items, args.repeat)
+        new_rate = measure(lambda item: compiled(item, timestamp), items, args.repeat)
+        print(f"  {source['name']:<10} old {old_rate:10,.0f} items/s   new {new_rate:10,.0f} items/s   "
+              f"x{new_rate / old_rate:.2f}")
+
+
+if __name__ == '__main__':
+    main()
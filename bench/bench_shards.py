@@ -0,0 +1,151 @@
+"""Scrape throughput with sources sharded over worker processes.
+
+Replays many copies of the fixtures (s0, s1, ... alternating Plaza and
+Roomspot) from a replay server in its own process, and runs complete cycles
+of every source with pages walked in the main process (--workers 0) and in
+1, 2, ... worker processes (shards.ShardPool). Every cycle publishes new
+listings first, so every page has changed and is fetched and parsed again.
+Throughput can only scale up to the number of free CPU cores.
+
+    python -m bench.bench_shards --sources 16 --items 600 --workers 0,1,2,4
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_webhook import start_fake_webhook
+from bench.replay_server import DEFAULT_FIXTURES
+from changes import ChangeTracker
+from filters import apply_subscriptions
+from http_session import create_session
+from notifier import NotificationDispatcher
+from pages import LOCAL_PAGES
+from router import Router
+from scraper import process_scraper
+from seen_store import SeenStore
+from shards import ShardPool
+from sources import load_sources
+
+SOURCES_PATH = os.path.join(os.path.dirname(__file__), '..', 'sources.json')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def start_replay_process(names, items, latency):
+    """Run bench.replay_server in a subprocess serving source s<n> from the fixture of names[n]."""
+    port = free_port()
+    command = [sys.executable, '-m', 'bench.replay_server', '--port', str(port), '--items', str(items),
+               '--latency', str(latency)]
+    for index, name in enumerate(names):
+        command += ['--fixture', f"s{index}={DEFAULT_FIXTURES[name]}"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, cwd=os.path.join(os.path.dirname(__file__), '..'))
+    base_url = f"http://127.0.0.1:{port}"
+    async with create_session() as session:
+        for _ in range(100):
+            try:
+                async with session.post(f"{base_url}/_admin/new?count=0"):
+                    return process, base_url
+            except OSError:
+                await asyncio.sleep(0.1)
+    process.kill()
+    raise RuntimeError("replay server did not start")
+
+
+async def run_cycle(session, router, sources, trackers, page_source):
+    results = await asyncio.gather(*(
+        process_scraper(session, router, key, source, trackers[key].store, tracker=trackers[key],
+                        page_source=page_source)
+        for key, source in sources.items()
+    ))
+    await router.dispatcher.join()
+    return sum(r['listings'] for r in results)
+
+
+async def bench(args, workers, sources, api_base, workdir):
+    """Listings per second over args.cycles cycles (after a warm-up) with `workers` worker processes."""
+    trackers = {
+        key: ChangeTracker(SeenStore(os.path.join(workdir, f"seen_{workers}_{key}.log")).load()) for key in sources
+    }
+    page_source = LOCAL_PAGES
+    if workers:
+        page_source = ShardPool(workers, log_level='WARNING')
+        page_source.start()
+    try:
+        async with create_session() as session:
+            dispatcher = NotificationDispatcher(session)
+            router = Router(dispatcher)
+            await run_cycle(session, router, sources, trackers, page_source)
+            listings = 0
+            elapsed = 0.0
+            for _ in range(args.cycles):
+                async with session.post(f"{api_base}/_admin/new?count={args.new_per_cycle}"):
+                    pass
+                start = time.perf_counter()
+                listings += await run_cycle(session, router, sources, trackers, page_source)
+                elapsed += time.perf_counter() - start
+            await dispatcher.close()
+    finally:
+        if workers:
+            await page_source.close()
+        for tracker in trackers.values():
+            tracker.store.close()
+    return listings / elapsed
+
+
+async def run(args, workdir):
+    templates = load_sources(SOURCES_PATH)
+    names = [list(DEFAULT_FIXTURES)[index % len(DEFAULT_FIXTURES)] for index in range(args.sources)]
+    replay, api_base = await start_replay_process(names, args.items, args.api_latency)
+    webhook_runner, _, webhook_base = await start_fake_webhook(limit=1000, window=1.0)
+    try:
+        sources = {}
+        for index, name in enumerate(names):
+            key = f"s{index}"
+            sources[key] = dict(templates[name], key=key, api_url=f"{api_base}/{key}/api/v1/actueel-aanbod",
+                                webhook_url=f"{webhook_base}/webhooks/{key}/token")
+        apply_subscriptions(sources, [])
+
+        results = []
+        for workers in args.workers:
+            results.append((workers, await bench(args, workers, sources, api_base, workdir)))
+    finally:
+        await webhook_runner.cleanup()
+        replay.terminate()
+        replay.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sources', type=int, default=16, help='replayed sources')
+    parser.add_argument('--items', type=int, default=600, help='listings per source')
+    parser.add_argument('--cycles', type=int, default=5, help='measured cycles per worker count (after one warm-up)')
+    parser.add_argument('--new-per-cycle', type=int, default=5, help='new listings published per source per cycle')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='replay server latency per page (s)')
+    parser.add_argument('--workers', default='0,1,2,4',
+                        help='comma-separated worker counts to compare; 0 walks pages in the main process')
+    args = parser.parse_args()
+    args.workers = [int(value) for value in args.workers.split(',')]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    print(f"{args.sources} sources x {args.items} listings, {args.cycles} cycles, {args.new_per_cycle} new per source "
+          f"per cycle, {args.api_latency * 1000:.0f} ms API latency, {os.cpu_count()} CPUs")
+    baseline = results[0][1]
+    for workers, rate in results:
+        label = f"{workers} workers" if workers else 'in-process'
+        print(f"  {label:<12} {rate:10,.0f} listings/s   x{rate / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
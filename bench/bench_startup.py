@@ -0,0 +1,66 @@
+"""Cold-start time and memory of the scraper's entry points.
+
+Imports each module in a fresh interpreter, several times, and reports the
+median wall time of the whole process and of the import itself, plus the
+process's max RSS. With --with, extra modules are imported first, e.g. to
+compare against the old runtime dependencies:
+
+    python -m bench.bench_startup
+    python -m bench.bench_startup --with discord --with requests
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Prints how long the imports took, in seconds
+PROBE = """
+import time
+start = time.perf_counter()
+{imports}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(modules, runs):
+    """Median (process seconds, import seconds, max RSS MiB) of importing `modules` in fresh interpreters."""
+    code = PROBE.format(imports='\n'.join(f"import {module}" for module in modules))
+    wall, imports, rss = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE)
+        output = process.stdout.read()
+        process.stdout.close()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall.append(time.perf_counter() - start)
+        if status:
+            sys.exit(f"Importing {', '.join(modules)} failed")
+        imports.append(float(output))
+        # ru_maxrss is in KiB on Linux
+        rss.append(usage.ru_maxrss / 1024)
+    return statistics.median(wall), statistics.median(imports), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=['scraper', 'history_cli'], help='modules to import')
+    parser.add_argument('--with', dest='extra', action='append', default=[], metavar='MODULE',
+                        help='also import this module first')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per module')
+    args = parser.parse_args()
+
+    _, baseline_imports, baseline_rss = measure([], args.runs)
+    print(f"{args.runs} runs each; bare interpreter: {baseline_rss:.1f} MiB max RSS")
+    for module in args.modules:
+        modules = args.extra + [module]
+        wall, imports, rss = measure(modules, args.runs)
+        print(f"  {' + '.join(modules):<36} process {wall * 1000:7.1f} ms   import {imports * 1000:7.1f} ms   "
+              f"max RSS {rss:6.1f} MiB (+{rss - baseline_rss:.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Local stand-in for a Discord webhook endpoint.
+
+Accepts webhook posts on /webhooks/<id>/<token>, as JSON or as multipart
+with attachments, enforces a Discord-like per-webhook rate limit
+(X-RateLimit-* headers and 429 retry_after), and can fail a fraction of
+requests. Run standalone with:
+
+    python -m bench.fake_webhook --port 8790
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+
+class FakeWebhookState:
+    """What the fake webhook received, per webhook path."""
+
+    def __init__(self, limit=5, window=2.0, failure_rate=0.0, latency=0.0):
+        self.limit = limit
+        self.window = window
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.messages = 0
+        self.embeds = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.attachments = 0
+        self.received = {}
+        self._buckets = {}
+
+    def _take(self, key):
+        now = time.monotonic()
+        reset_at, remaining = self._buckets.get(key, (now + self.window, self.limit))
+        if now >= reset_at:
+            reset_at, remaining = now + self.window, self.limit
+        if remaining <= 0:
+            return False, 0, reset_at - now
+        remaining -= 1
+        self._buckets[key] = (reset_at, remaining)
+        return True, remaining, reset_at - now
+
+
+def create_app(state):
+    async def handle(request):
+        key = request.match_info['webhook_id']
+        allowed, remaining, reset_after = state._take(key)
+        headers = {
+            'X-RateLimit-Limit': str(state.limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}"
+        }
+        if not allowed:
+            state.rate_limited += 1
+            return web.json_response(
+                {'message': 'You are being rate limited.', 'retry_after': round(reset_after, 3), 'global': False},
+                status=429,
+                headers=headers
+            )
+
+        if state.latency:
+            await asyncio.sleep(state.latency)
+
+        if state.failure_rate and random.random() < state.failure_rate:
+            state.failed += 1
+            return web.Response(status=502, text='Bad Gateway', headers=headers)
+
+        if request.content_type == 'multipart/form-data':
+            # A message with attachments: the JSON is in payload_json, files in files[n]
+            form = await request.post()
+            payload = json.loads(form['payload_json'])
+            state.attachments += sum(1 for name in form if name.startswith('files['))
+        else:
+            payload = await request.json()
+        embeds = payload.get('embeds', [])
+        state.messages += 1
+        state.embeds += len(embeds)
+        state.received.setdefault(key, []).extend(embeds)
+        return web.Response(status=204, headers=headers)
+
+    app = web.Application()
+    app.router.add_post('/webhooks/{webhook_id}/{token}', handle)
+    return app
+
+
+async def start_fake_webhook(host='127.0.0.1', port=0, **options):
+    """Start the fake webhook server. Returns (runner, state, base_url)."""
+    state = FakeWebhookState(**options)
+    runner = web.AppRunner(create_app(state))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, state, f"http://{host}:{bound_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--limit', type=int, default=5, help='requests per rate-limit window')
+    parser.add_argument('--window', type=float, default=2.0, help='rate-limit window in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = FakeWebhookState(limit=args.limit, window=args.window, failure_rate=args.failure_rate)
+    web.run_app(create_app(state), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Local stand-in for the zig365 aanbod API that replays recorded responses.
+
+Serves POST /<source>/api/v1/actueel-aanbod for every fixture, paginated by
+the request's `page` and `limit`. Fixtures are either a single response JSON
+file or a directory of page-<n>.json files recorded with RECORD_DIR. The
+items can be expanded to a larger listing count, new listings can be added
+between cycles (from another process with POST /_admin/new?count=<n>), and
+latency, errors, 429s and hanging requests can be injected. Run standalone
+with:
+
+    python -m bench.replay_server --fixture plaza=recordings/mosaic-plaza-aanbodapi.zig365.nl
+"""
+import argparse
+import asyncio
+import copy
+import glob
+import json
+import os
+import random
+
+from aiohttp import web
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+DEFAULT_FIXTURES = {
+    'plaza': os.path.join(FIXTURE_DIR, 'aanbod_plaza.json'),
+    'roomspot': os.path.join(FIXTURE_DIR, 'aanbod_roomspot.json')
+}
+
+
+def load_fixture_items(path):
+    """Items of a recorded response file, or of all page-<n>.json files in a directory."""
+    if os.path.isdir(path):
+        files = sorted(
+            glob.glob(os.path.join(path, 'page-*.json')),
+            key=lambda name: int(os.path.basename(name)[5:-5])
+        )
+    else:
+        files = [path]
+
+    items = []
+    for name in files:
+        with open(name, 'r', encoding='utf-8') as f:
+            items.extend(json.load(f).get('data', []))
+    if not items:
+        raise ValueError(f"No items found in fixture {path}")
+    return items
+
+
+class ReplaySource:
+    """The listings currently 'online' for one replayed source."""
+
+    def __init__(self, templates, total_items=None):
+        self.templates = templates
+        self._next_id = 1_000_000
+        self.items = list(templates)
+        if total_items and total_items > len(self.items):
+            self.items.extend(self._clone() for _ in range(total_items - len(self.items)))
+        self._body_cache = {}
+
+    def _clone(self):
+        item = copy.deepcopy(self.templates[self._next_id % len(self.templates)])
+        item['id'] = self._next_id
+        item['houseNumber'] = str(self._next_id % 500 + 1)
+        self._next_id += 1
+        return item
+
+    def add_new(self, count):
+        """Publish `count` new listings (they appear on the first page)."""
+        self.items[:0] = [self._clone() for _ in range(count)]
+        self._body_cache.clear()
+
+    def page_body(self, page, limit):
+        key = (page, limit)
+        if key not in self._body_cache:
+            data = self.items[page * limit:(page + 1) * limit]
+            self._body_cache[key] = json.dumps({
+                'data': data,
+                '_metadata': {'limit': limit, 'offset': page * limit, 'total_search_count': len(self.items)}
+            }).encode()
+        return self._body_cache[key]
+
+
+class ReplayState:
+    def __init__(self, sources, latency=0.0, error_rate=0.0, rate_limit_rate=0.0, stall_rate=0.0, stall=30.0):
+        self.sources = sources
+        self.latency = latency
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests = 0
+        self.errors = 0
+        self.stalls = 0
+
+
+def create_app(state):
+    async def handle(request):
+        source = state.sources.get(request.match_info['source'])
+        if source is None:
+            return web.Response(status=404)
+        state.requests += 1
+
+        if state.latency:
+            await asyncio.sleep(state.latency)
+        if state.stall_rate and random.random() < state.stall_rate:
+            # A hung connection: no answer for a long time
+            state.stalls += 1
+            await asyncio.sleep(state.stall)
+
+        roll = random.random()
+        if roll < state.error_rate:
+            state.errors += 1
+            return web.Response(status=500, text='Injected error')
+        if roll < state.error_rate + state.rate_limit_rate:
+            state.errors += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+
+        await request.read()
+        page = int(request.query.get('page', 0))
+        limit = int(request.query.get('limit', 60))
+        return web.Response(body=source.page_body(page, limit), content_type='application/json')
+
+    async def publish(request):
+        count = int(request.query.get('count', 1))
+        for source in state.sources.values():
+            source.add_new(count)
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_post('/{source}/api/v1/actueel-aanbod', handle)
+    app.router.add_post('/_admin/new', publish)
+    return app
+
+
+async def start_replay_server(fixtures=None, total_items=None, host='127.0.0.1', port=0, **options):
+    """Start the replay server. Returns (runner, state, base_url).
+
+    `fixtures` maps source names to fixture paths (default: bench/fixtures);
+    the API of source <name> is then at <base_url>/<name>/api/v1/actueel-aanbod.
+    """
+    sources = {
+        name: ReplaySource(load_fixture_items(path), total_items=total_items)
+        for name, path in (fixtures or DEFAULT_FIXTURES).items()
+    }
+    state = ReplayState(sources, **options)
+    runner = web.AppRunner(create_app(state))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, state, f"http://{host}:{bound_port}"
+
+
+def parse_fixture_args(values):
+    fixtures = {}
+    for value in values or []:
+        name, _, path = value.partition('=')
+        if not path:
+            raise SystemExit(f"--fixture expects name=path, got {value!r}")
+        fixtures[name] = path
+    return fixtures or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8791)
+    parser.add_argument('--fixture', action='append', metavar='NAME=PATH',
+                        help='fixture file or recording directory per source (default: bench/fixtures)')
+    parser.add_argument('--items', type=int, default=None, help='expand every source to this many listings')
+    parser.add_argument('--latency', type=float, default=0.0, help='response latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='fraction of requests that hang')
+    parser.add_argument('--stall', type=float, default=30.0, help='how long a hanging request hangs (s)')
+    args = parser.parse_args()
+
+    sources = {
+        name: ReplaySource(load_fixture_items(path), total_items=args.items)
+        for name, path in (parse_fixture_args(args.fixture) or DEFAULT_FIXTURES).items()
+    }
+    state = ReplayState(sources, latency=args.latency, error_rate=args.error_rate,
+                        rate_limit_rate=args.rate_limit_rate, stall_rate=args.stall_rate, stall=args.stall)
+    web.run_app(create_app(state), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import hashlib
+from dataclasses import dataclass, field
+
+from listing import Listing, address_key
+
+# Kinds of listing events a cycle can produce
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+EVENT_TYPES = (ADDED, CHANGED, REMOVED)
+
+# Listing attributes covered by the fingerprint
+FINGERPRINT_FIELDS = ('price', 'area', 'property_type', 'img_url')
+
+
+def fingerprint(listing):
+    """Short content hash of the listing attributes whose changes are reported."""
+    content = repr((listing.price, listing.area, listing.property_type, listing.img_url))
+    return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+
+@dataclass(slots=True)
+class ListingEvent:
+    """Something that happened to a listing between two cycles.
+
+    `relisted` marks an added listing that had disappeared before. For a
+    changed listing, `changes` names the changed attributes and
+    `previous_price` is its price before the change. `also_on` holds the
+    (source name, link) of other sources listing the same dwelling, and
+    `sent` the digests of the webhooks the dwelling reached with this event.
+    """
+
+    kind: str
+    listing: Listing
+    relisted: bool = False
+    previous_price: float | None = None
+    changes: tuple = field(default=())
+    also_on: tuple = field(default=())
+    sent: tuple = field(default=())
+
+
+def apply_event(store, event):
+    """Record an event in the seen store, once its notification went out (or none was wanted)."""
+    listing = event.listing
+    if event.kind == REMOVED:
+        store.mark_gone(listing.id)
+    else:
+        store.add(listing.id, fingerprint=fingerprint(listing), price=listing.price, address=address_key(listing),
+                  link=listing.link, sent=event.sent)
+
+
+class ChangeTracker:
+    """Diffs the listings of one source against its seen store, cycle by cycle.
+
+    The snapshots live in the seen store; the tracker only keeps the last
+    parsed Listing per ID (to describe changes and withdrawn listings) and
+    the IDs on each page, so a page that is unchanged since the last cycle
+    still counts as present. Removals are only reported after a cycle that
+    saw every page of the results.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._listings = {}
+        self._page_ids = {}
+        self._present = set()
+        self._complete = True
+        self._last_page = -1
+        self._quiet = False
+
+    def reset(self):
+        """The query changed (endpoint or payload): forget the page layout.
+
+        Listings missing from the next complete walk most likely fell outside
+        the new query rather than being withdrawn, so they are marked gone
+        without REMOVED events.
+        """
+        self._page_ids.clear()
+        self._quiet = True
+
+    def start_cycle(self):
+        self._present = set()
+        self._complete = True
+        self._last_page = -1
+
+    def diff(self, listing):
+        """Compare a listing whose ID is in the seen store. Returns a ListingEvent or None.
+
+        Call it before record_page for the listing's page.
+        """
+        store = self.store
+        if store.is_gone(listing.id):
+            return ListingEvent(ADDED, listing, relisted=True)
+
+        snapshot = store.snapshot(listing.id)
+        current = fingerprint(listing)
+        if snapshot is None:
+            # Seen before snapshots were stored: start tracking silently
+            store.set_snapshot(listing.id, current, listing.price)
+            return None
+        if snapshot[0] == current:
+            return None
+
+        previous = self._listings.get(listing.id)
+        changes = ()
+        if previous is not None:
+            changes = tuple(name for name in FINGERPRINT_FIELDS
+                            if getattr(previous, name) != getattr(listing, name))
+        if not changes and snapshot[1] != listing.price:
+            changes = ('price',)
+        return ListingEvent(CHANGED, listing, previous_price=snapshot[1], changes=changes)
+
+    def record_page(self, page, listings):
+        """Note the listings of a walked page; None for a page unchanged since the last cycle."""
+        if listings is None:
+            ids = self._page_ids.get(page)
+            if ids is None:
+                self._complete = False
+                return
+        else:
+            ids = [listing.id for listing in listings]
+            self._page_ids[page] = ids
+            for listing in listings:
+                self._listings[listing.id] = listing
+        self._present.update(ids)
+        self._last_page = page
+
+    @property
+    def present(self):
+        """IDs on the pages walked this cycle, including unchanged ones."""
+        return self._present
+
+    def listed(self):
+        """IDs still listed as far as this cycle knows.
+
+        Those on the pages walked this cycle and, if the walk stopped early,
+        those the later pages had when they were last walked.
+        """
+        if self._complete:
+            return self._present
+        ids = set(self._present)
+        for page, page_ids in self._page_ids.items():
+            if page > self._last_page:
+                ids.update(page_ids)
+        return ids
+
+    def mark_incomplete(self):
+        """The walk stopped before the last page, so absent IDs may still be listed."""
+        self._complete = False
+
+    def removed(self, max_pages):
+        """REMOVED events for live IDs that were not on any page of a complete walk.
+
+        A walk that reached `max_pages` may have been cut off, and an empty one
+        is more likely an API glitch than every listing being withdrawn, so
+        neither reports anything.
+        """
+        if not self._complete or self._last_page >= max_pages - 1 or not self._present:
+            return []
+
+        for listing_id in [listing_id for listing_id in self._listings if self.store.is_gone(listing_id)]:
+            del self._listings[listing_id]
+
+        quiet, self._quiet = self._quiet, False
+        events = []
+        for listing_id in self.store.live_ids():
+            if listing_id in self._present:
+                continue
+            listing = self._listings.get(listing_id)
+            if listing is None or quiet:
+                # Withdrawn before this process saw it (or left the query): just record it
+                self.store.mark_gone(listing_id)
+                continue
+            events.append(ListingEvent(REMOVED, listing))
+        return events
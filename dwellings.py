@@ -0,0 +1,103 @@
+import hashlib
+
+from listing import address_key
+
+
+def webhook_digest(url):
+    """Short hash a webhook is recorded by in the seen stores, so its token isn't written to disk."""
+    return hashlib.blake2b(url.encode(), digest_size=8).hexdigest()
+
+
+class DwellingIndex:
+    """Listings of every source clustered by the dwelling they are for.
+
+    Maps each address key (listing.address_key) to the listing of every
+    source that carries the dwelling, with its link, so finding the same
+    dwelling on other sources is one dict lookup per listing. Seen-store
+    records carry the address key and link of their listing, so the index
+    is rebuilt from the stores when sources start. The webhooks a dwelling
+    was announced to are the ones its stores recorded as delivered, plus
+    those `sending(source_key, listing_id)` (Router.sending) reports for an
+    announcement still on its way. A listing drops out of its cluster once
+    it is marked gone or evicted from its store and has no pending
+    announcement.
+    """
+
+    def __init__(self, sending=None):
+        self._clusters = {}
+        self._keys = {}
+        self._sources = {}
+        self._sending = sending or (lambda source_key, listing_id: ())
+
+    def attach(self, source_key, config, store):
+        """Index a started source's live listings from its seen store."""
+        self._sources[source_key] = (config, store)
+        for listing_id, address, link in store.addresses():
+            self._put(source_key, listing_id, address, link)
+
+    def update(self, source_key, config):
+        """Use a reloaded config for a running source."""
+        self._sources[source_key] = (config, self._sources[source_key][1])
+
+    def detach(self, source_key):
+        """Forget a stopped source and its listings."""
+        self._sources.pop(source_key, None)
+        for source, listing_id in [key for key in self._keys if key[0] == source_key]:
+            self.discard(source, listing_id)
+
+    def add(self, source_key, listing):
+        """Put a listing in its dwelling's cluster. Returns the address key, or None without a full address."""
+        address = address_key(listing)
+        if address is not None:
+            self._put(source_key, listing.id, address, listing.link)
+        return address
+
+    def prune(self, source_key):
+        """Drop the listings of a source that are no longer live, e.g. after its store evicted expired IDs."""
+        store = self._sources[source_key][1]
+        for source, listing_id in [key for key in self._keys if key[0] == source_key]:
+            if self._sent(source, listing_id, store) is None:
+                self.discard(source, listing_id)
+
+    def _sent(self, source_key, listing_id, store):
+        """Webhook digests a listing's dwelling was announced to, or None if the listing is not live."""
+        sending = self._sending(source_key, listing_id)
+        if not sending and (listing_id not in store or store.is_gone(listing_id)):
+            return None
+        return store.sent(listing_id) | {webhook_digest(url) for url in sending}
+
+    def _put(self, source_key, listing_id, address, link):
+        previous = self._keys.get((source_key, listing_id))
+        if previous is not None and previous != address:
+            self.discard(source_key, listing_id)
+        self._keys[(source_key, listing_id)] = address
+        self._clusters.setdefault(address, {})[source_key] = (listing_id, link)
+
+    def discard(self, source_key, listing_id):
+        address = self._keys.pop((source_key, listing_id), None)
+        cluster = self._clusters.get(address)
+        # A later listing of the same source may have taken the dwelling's place
+        if cluster and cluster.get(source_key, (None,))[0] == listing_id:
+            del cluster[source_key]
+            if not cluster:
+                del self._clusters[address]
+
+    def others(self, source_key, address):
+        """(config, link, sent) of the running sources other than `source_key` that carry the dwelling.
+
+        `sent` holds the digests of the webhooks each of them announced it to.
+        """
+        others = []
+        for source, (listing_id, link) in list(self._clusters.get(address, {}).items()):
+            if source == source_key or source not in self._sources:
+                continue
+            config, store = self._sources[source]
+            sent = self._sent(source, listing_id, store)
+            if sent is None:
+                self.discard(source, listing_id)
+                continue
+            others.append((config, link, sent))
+        return others
+
+    def __len__(self):
+        return len(self._clusters)
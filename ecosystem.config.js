@@ -22,8 +22,8 @@ module.exports = {
     min_uptime: '10s',
     // Monitoring
     pmx: true,
-    // Auto restart on crash
-    kill_timeout: 1600,
+    // Time to finish a graceful shutdown (SHUTDOWN_GRACE plus stopping workers) before SIGKILL
+    kill_timeout: 15000,
     listen_timeout: 3000,
     // Environment variables (you can add more here)
     env_production: {
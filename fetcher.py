@@ -0,0 +1,439 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import urllib.parse
+
+import aiohttp
+
+from metrics import Histogram, register_stats
+
+logger = logging.getLogger(__name__)
+
+# Default paging parameters for the zig365 aanbod API
+PAGE_SIZE = 60
+MAX_PAGES = 10
+PAGE_CONCURRENCY = 3
+
+# Sort orders understood by the aanbod API
+SORT_BY_PRICE = '+reactionData.aangepasteTotaleHuurprijs'
+SORT_BY_PUBLICATION_DATE = '-publicationDate'
+
+# Timeouts (seconds) of a single page request, tighter than the session's so a hung API connection is given up quickly
+PAGE_TIMEOUT = aiohttp.ClientTimeout(
+    total=float(os.getenv('FETCH_TIMEOUT', '20')),
+    connect=float(os.getenv('FETCH_CONNECT_TIMEOUT', '5')),
+    sock_read=float(os.getenv('FETCH_READ_TIMEOUT', '15'))
+)
+
+# Retries of a page after a transient failure (timeout, connection error, 5xx), the first one after FETCH_RETRY_DELAY
+# seconds and doubling from there
+FETCH_RETRIES = int(os.getenv('FETCH_RETRIES', '2'))
+FETCH_RETRY_DELAY = float(os.getenv('FETCH_RETRY_DELAY', '1'))
+
+# A page request without an answer after this many seconds gets an identical backup request; the first answer wins.
+# 0 disables hedging
+FETCH_HEDGE_DELAY = float(os.getenv('FETCH_HEDGE_DELAY', '3'))
+
+# Consecutive failed walks after which a source's circuit breaker opens, and seconds until it lets a probe through
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '3'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '600'))
+
+
+class FetchError(Exception):
+    """A page request failed. `retry_after` is set when the server asked us to slow down."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def transient(self):
+        """Whether retrying right away may help: network errors, timeouts and server errors, not 4xx or 429."""
+        return self.status is None or self.status >= 500
+
+
+class CircuitOpenError(FetchError):
+    """The source's circuit breaker is open, so its API is not contacted."""
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# Marker returned for a page whose content is identical to the previous fetch
+UNCHANGED = object()
+
+# Validators and body digest of the last response per page request
+_page_cache = {}
+
+# How often each endpoint's pages were forgotten, so a page fetched before forget_pages isn't remembered after it
+_forgotten = {}
+
+# Directory raw page responses are recorded to, see enable_recording
+_record_dir = None
+
+# Circuit breaker per source (or API host), see breaker_for
+_breakers = {}
+
+# Counters for how often a fetch could be skipped or short-circuited, retried or hedged
+FETCH_STATS = {
+    'pages_fetched': 0,
+    'pages_not_modified': 0,
+    'pages_unchanged': 0,
+    'requests_retried': 0,
+    'requests_hedged': 0
+}
+register_stats('scraper_fetch', FETCH_STATS, 'Page fetch outcomes, see fetcher.FETCH_STATS')
+
+# How often circuit breakers opened, let a probe through, and rejected a walk
+BREAKER_STATS = {
+    'opened': 0,
+    'probes': 0,
+    'rejected': 0
+}
+register_stats('scraper_breaker', BREAKER_STATS, 'Circuit breaker transitions, see fetcher.BREAKER_STATS')
+
+FETCH_SECONDS = Histogram(
+    'scraper_fetch_seconds', 'Time to fetch one API page, from request to last body byte', ['source']
+)
+JSON_DECODE_SECONDS = Histogram('scraper_json_decode_seconds', 'Time to decode one API page', ['source'])
+
+
+def enable_recording(directory):
+    """Save every raw page response to <directory>/<api host>/page-<n>.json for offline replay."""
+    global _record_dir
+    _record_dir = directory
+
+
+def _record(api_url, page, body):
+    target = os.path.join(_record_dir, urllib.parse.urlsplit(api_url).netloc)
+    os.makedirs(target, exist_ok=True)
+    with open(os.path.join(target, f"page-{page}.json"), 'wb') as f:
+        f.write(body)
+
+
+class CircuitBreaker:
+    """Stops walking an API that keeps failing, and probes it again after a while.
+
+    Closed, every walk goes ahead. After `failure_threshold` consecutive
+    failed walks it opens: walks raise CircuitOpenError without contacting
+    the API. Once `reset_timeout` seconds passed it is half-open: the next
+    walk is a probe, fetching one page at a time; its first page closes the
+    breaker again, a failure reopens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def check(self, now=None):
+        """Raise CircuitOpenError while open; switch to half-open once the reset timeout passed."""
+        if self.state != self.OPEN:
+            return
+        remaining = self.opened_at + self.reset_timeout - (now or time.monotonic())
+        if remaining > 0:
+            BREAKER_STATS['rejected'] += 1
+            raise CircuitOpenError(
+                f"{self.name}: circuit breaker open after {self.failures} failed walks, next probe in "
+                f"{remaining:.0f} seconds",
+                retry_after=remaining
+            )
+        self.state = self.HALF_OPEN
+        BREAKER_STATS['probes'] += 1
+        logger.info("🩺 %s: probing the API again", self.name)
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ %s: API is answering again, circuit breaker closed", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self, now=None):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = now or time.monotonic()
+            BREAKER_STATS['opened'] += 1
+            logger.warning("🔌 %s: %d failed walks in a row, pausing requests for %.0f seconds",
+                           self.name, self.failures, self.reset_timeout)
+
+
+def breaker_for(name):
+    """The circuit breaker of a source, created on first use."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def build_page_url(api_url, page, page_size=PAGE_SIZE, sort=SORT_BY_PRICE, locale='en_GB'):
+    """Build the aanbod URL for a single result page."""
+    query = urllib.parse.urlencode({
+        'limit': page_size,
+        'locale': locale,
+        'page': page,
+        'sort': sort
+    })
+    return f"{api_url}?{query}"
+
+
+def _cache_key(url, payload):
+    body = json.dumps(payload, sort_keys=True).encode()
+    return url, hashlib.sha1(body).hexdigest()
+
+
+async def fetch_page(session, api_url, page, payload, headers, page_size=PAGE_SIZE, sort=SORT_BY_PRICE,
+                     source=None):
+    """Fetch and decode one page.
+
+    Returns (data, cache_entry). data is the response dict, or UNCHANGED when
+    the server answers 304 or the body hashes the same as last time; the
+    cache_entry then holds the remembered page it was compared against, with
+    its "count" and "page_count". A slow request is hedged and transient
+    failures are retried (FETCH_HEDGE_DELAY, FETCH_RETRIES); failures that
+    remain raise FetchError. cache_entry must be passed to remember_page once
+    the page has been processed, so a page that was fetched but never
+    consumed is not skipped next time. Timings are labelled with `source`
+    (default: the API host).
+    """
+    label = source or urllib.parse.urlsplit(api_url).netloc
+    url = build_page_url(api_url, page, page_size=page_size, sort=sort)
+    key = _cache_key(url, payload)
+    cached = _page_cache.get(key)
+    generation = _forgotten.get(api_url, 0)
+
+    request_headers = headers
+    if cached and (cached['etag'] or cached['last_modified']):
+        request_headers = dict(headers)
+        if cached['etag']:
+            request_headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            request_headers['If-Modified-Since'] = cached['last_modified']
+
+    start = time.perf_counter()
+    description = f"{api_url} page {page}"
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            status, body, etag, last_modified = await _post_hedged(session, url, payload, request_headers, description)
+            break
+        except FetchError as e:
+            if not e.transient or attempt == FETCH_RETRIES:
+                raise
+            FETCH_STATS['requests_retried'] += 1
+            delay = FETCH_RETRY_DELAY * 2 ** attempt
+            logger.debug("🔁 %s failed (%s), retrying in %.1f seconds", description, e, delay)
+            await asyncio.sleep(delay)
+    if status == 304:
+        if not cached:
+            raise FetchError(f"{description} returned status code 304", status=304)
+        FETCH_STATS['pages_not_modified'] += 1
+        FETCH_SECONDS.labels(label).observe(time.perf_counter() - start)
+        return UNCHANGED, (api_url, generation, key, cached)
+    FETCH_SECONDS.labels(label).observe(time.perf_counter() - start)
+
+    if _record_dir:
+        _record(api_url, page, body)
+
+    digest = hashlib.sha1(body).digest()
+    if cached and cached['digest'] == digest:
+        FETCH_STATS['pages_unchanged'] += 1
+        return UNCHANGED, (api_url, generation, key, cached)
+
+    try:
+        with JSON_DECODE_SECONDS.labels(label).time():
+            data = json.loads(body)
+    except ValueError as e:
+        raise FetchError(f"{api_url} page {page} returned invalid JSON: {e}") from e
+    count = len(data['data']) if isinstance(data, dict) and isinstance(data.get('data'), list) else 0
+    entry = {
+        'etag': etag,
+        'last_modified': last_modified,
+        'digest': digest,
+        'count': count,
+        'page_count': _page_count_hint(data, page_size) if page == 0 else None
+    }
+    return data, (api_url, generation, key, entry)
+
+
+async def _post(session, url, payload, headers, description):
+    """Send one page request. Returns (status, body, etag, last_modified); failures raise FetchError."""
+    try:
+        async with session.post(url, headers=headers, json=payload, timeout=PAGE_TIMEOUT) as response:
+            FETCH_STATS['pages_fetched'] += 1
+            if response.status == 304:
+                return 304, None, None, None
+            if response.status != 200:
+                raise FetchError(
+                    f"{description} returned status code {response.status}",
+                    status=response.status,
+                    retry_after=_retry_after(response)
+                )
+            body = await response.read()
+            return 200, body, response.headers.get('ETag'), response.headers.get('Last-Modified')
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise FetchError(f"Error fetching {description}: {e!r}") from e
+
+
+async def _post_hedged(session, url, payload, headers, description):
+    """_post, with a backup request if the first one is slower than FETCH_HEDGE_DELAY.
+
+    Whichever answers successfully first wins and the other is cancelled;
+    if both fail, the last failure is raised.
+    """
+    tasks = [asyncio.ensure_future(_post(session, url, payload, headers, description))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=FETCH_HEDGE_DELAY or None)
+        if done:
+            return tasks[0].result()
+        FETCH_STATS['requests_hedged'] += 1
+        tasks.append(asyncio.ensure_future(_post(session, url, payload, headers, description)))
+        error = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except FetchError as e:
+                error = e
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def remember_page(cache_entry):
+    """Store the validators and digest of a processed page for the next fetch.
+
+    Skipped if the endpoint was forgotten since the page was fetched.
+    """
+    api_url, generation, key, entry = cache_entry
+    if _forgotten.get(api_url, 0) == generation:
+        _page_cache[key] = entry
+
+
+def forget_pages(api_url):
+    """Drop remembered validators of an endpoint so its next walk parses every page."""
+    _forgotten[api_url] = _forgotten.get(api_url, 0) + 1
+    prefix = f"{api_url}?"
+    for key in [key for key in _page_cache if key[0].startswith(prefix)]:
+        del _page_cache[key]
+
+
+def _reported_total(data):
+    """The number of results according to the response metadata, if the API reports it."""
+    metadata = data.get('_metadata') if isinstance(data, dict) else None
+    total = metadata.get('total_search_count') if isinstance(metadata, dict) else None
+    return total if isinstance(total, int) else None
+
+
+def _page_count_hint(data, page_size):
+    """Derive the number of pages from the response metadata, if the API reports it."""
+    total = _reported_total(data)
+    if total is None:
+        return None
+    return max(1, -(-total // page_size))
+
+
+async def iter_pages(session, api_url, payload, headers, page_size=PAGE_SIZE, sort=SORT_BY_PRICE,
+                     max_pages=MAX_PAGES, concurrency=PAGE_CONCURRENCY, source=None):
+    """Walk the result pages of an aanbod endpoint, yielding each page's items in page order.
+
+    Items are None for a page that is unchanged since the previous walk.
+
+    Up to `concurrency` pages are requested ahead of the one being consumed, so
+    the caller can already process page 0 while later pages are downloading.
+    The walk ends at the first short page, at `max_pages`, or when the caller
+    stops iterating; outstanding requests are cancelled then. A page counts
+    as processed (and is skipped next time if unchanged) once the caller
+    asks for the next one or stops iterating after it. A failed page
+    raises FetchError, so an outage never looks like an empty result; an
+    empty first page that reports listings in its metadata counts as failed.
+
+    Walks go through the source's circuit breaker: while it is open they
+    raise CircuitOpenError right away, and a probe walk fetches one page at
+    a time.
+    """
+    breaker = breaker_for(source or urllib.parse.urlsplit(api_url).netloc)
+    breaker.check()
+    pending = {}
+    next_page = 0
+    last_page = max_pages - 1
+
+    def schedule():
+        nonlocal next_page
+        # A probe walk doesn't look ahead, so a still failing API gets a single request
+        limit = 1 if breaker.state == breaker.HALF_OPEN else concurrency
+        while next_page <= last_page and len(pending) < limit:
+            pending[next_page] = asyncio.ensure_future(
+                fetch_page(session, api_url, next_page, payload, headers, page_size=page_size, sort=sort,
+                           source=source)
+            )
+            next_page += 1
+
+    try:
+        page = 0
+        schedule()
+        while page in pending:
+            try:
+                data, cache_entry = await pending.pop(page)
+
+                if data is UNCHANGED:
+                    # Identical to the last cycle: reuse the remembered page shape, skip the items
+                    cached = cache_entry[3]
+                    if cached['page_count'] is not None:
+                        last_page = min(last_page, cached['page_count'] - 1)
+                    if cached['count'] < page_size:
+                        last_page = page
+                    items = None
+                elif not isinstance(data, dict) or not isinstance(data.get('data'), list):
+                    raise FetchError(f"{api_url} page {page} returned an unexpected response")
+                else:
+                    items = data['data']
+                    if page == 0:
+                        total = _reported_total(data)
+                        if not items and total:
+                            raise FetchError(f"{api_url} returned no listings but reports {total}")
+                        hint = _page_count_hint(data, page_size)
+                        if hint is not None:
+                            last_page = min(last_page, hint - 1)
+
+                    if len(items) < page_size:
+                        last_page = page
+            except FetchError:
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+
+            # Drop look-ahead requests past the last page before handing control back
+            for extra in [p for p in pending if p > last_page]:
+                pending.pop(extra).cancel()
+            schedule()
+
+            try:
+                yield page, items
+            except GeneratorExit:
+                # The caller stopped after this page (e.g. at the first page without new listings)
+                remember_page(cache_entry)
+                raise
+            remember_page(cache_entry)
+            page += 1
+    finally:
+        for task in pending.values():
+            if task.done() and not task.cancelled():
+                # Consume the result so a failed look-ahead page is not reported as unhandled
+                task.exception()
+            task.cancel()
@@ -0,0 +1,207 @@
+import bisect
+import copy
+import json
+import os
+import re
+
+# Rule keys understood by a subscription
+RULE_KEYS = ('max_rent', 'min_area', 'dwelling_types', 'floors', 'postal_prefixes', 'street_keywords')
+
+_WORDS = re.compile(r'[a-z0-9]+')
+
+
+def load_subscriptions(path):
+    """Load the "subscriptions" list of the config file. Raises ValueError if invalid.
+
+    A subscription's own Discord webhook is read from the environment variable
+    named by its "webhook_env" (or a literal "webhook_url") into "webhook".
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path} must hold a JSON object")
+    subscriptions = raw.get('subscriptions', [])
+    if not isinstance(subscriptions, list):
+        raise ValueError('"subscriptions" must be a list')
+    for i, subscription in enumerate(subscriptions):
+        if not isinstance(subscription, dict):
+            raise ValueError(f"Subscription {i + 1} must be an object")
+        subscription.setdefault('name', f"subscription-{i + 1}")
+        for key in ('name', 'webhook_env', 'webhook_url'):
+            if subscription.get(key) is not None and not isinstance(subscription[key], str):
+                raise ValueError(f"Subscription {i + 1}: {key} must be a string")
+        unknown = set(subscription) - set(RULE_KEYS) - {'name', 'sources', 'webhook_env', 'webhook_url'}
+        if unknown:
+            raise ValueError(f"Subscription '{subscription['name']}' has unknown keys: {', '.join(sorted(unknown))}")
+        for key in ('max_rent', 'min_area'):
+            if key in subscription and not isinstance(subscription[key], (int, float)):
+                raise ValueError(f"Subscription '{subscription['name']}': {key} must be a number")
+        for key in ('dwelling_types', 'floors', 'postal_prefixes', 'street_keywords', 'sources'):
+            if key in subscription and not isinstance(subscription[key], list):
+                raise ValueError(f"Subscription '{subscription['name']}': {key} must be a list")
+        subscription['webhook'] = subscription.get('webhook_url') or (
+            os.getenv(subscription['webhook_env']) if subscription.get('webhook_env') else None
+        )
+    return subscriptions
+
+
+def _normalize(value):
+    return str(value).strip().lower()
+
+
+def _postal(value):
+    return str(value).replace(' ', '').upper()
+
+
+class RuleIndex:
+    """Matches a listing against many subscriptions at once.
+
+    Every rule dimension is precomputed into bitmasks over the subscriptions
+    (bit i = subscription i passes). Thresholds are looked up with bisect,
+    categories and postal-code prefixes with dict lookups and street keywords
+    per word of the street, so matching a listing costs a handful of lookups
+    and integer ANDs however many subscriptions there are. Listings with an
+    unknown price or area are not filtered out on that dimension.
+    """
+
+    def __init__(self, subscriptions):
+        self.subscriptions = list(subscriptions)
+        everyone = (1 << len(self.subscriptions)) - 1
+        self.all = everyone
+
+        # max_rent: listing passes rules whose limit is >= its price -> suffix of the sorted limits
+        rent_rules = sorted((s['max_rent'], i) for i, s in enumerate(self.subscriptions) if 'max_rent' in s)
+        self._rent_limits = [limit for limit, _ in rent_rules]
+        self._rent_masks = self._suffix_masks(rent_rules)
+        self._rent_free = everyone & ~self._mask(i for _, i in rent_rules)
+
+        # min_area: listing passes rules whose minimum is <= its area -> prefix of the sorted minimums
+        area_rules = sorted((s['min_area'], i) for i, s in enumerate(self.subscriptions) if 'min_area' in s)
+        self._area_minimums = [minimum for minimum, _ in area_rules]
+        self._area_masks = self._prefix_masks(area_rules)
+        self._area_free = everyone & ~self._mask(i for _, i in area_rules)
+
+        self._types, self._types_free = self._category_index('dwelling_types', _normalize)
+        self._floors, self._floors_free = self._category_index('floors', _normalize)
+        self._postal, self._postal_free = self._category_index('postal_prefixes', _postal)
+        self._postal_lengths = sorted({len(prefix) for prefix in self._postal})
+        self._keywords, self._keywords_free = self._category_index('street_keywords', _normalize)
+        self._keyword_max = max((len(keyword) for keyword in self._keywords), default=0)
+
+    @staticmethod
+    def _mask(indexes):
+        mask = 0
+        for i in indexes:
+            mask |= 1 << i
+        return mask
+
+    @staticmethod
+    def _suffix_masks(rules):
+        masks = [0] * (len(rules) + 1)
+        for position in range(len(rules) - 1, -1, -1):
+            masks[position] = masks[position + 1] | (1 << rules[position][1])
+        return masks
+
+    @staticmethod
+    def _prefix_masks(rules):
+        masks = [0] * (len(rules) + 1)
+        for position, (_, i) in enumerate(rules):
+            masks[position + 1] = masks[position] | (1 << i)
+        return masks
+
+    def _category_index(self, key, normalize):
+        index = {}
+        constrained = 0
+        for i, subscription in enumerate(self.subscriptions):
+            values = subscription.get(key)
+            if not values:
+                continue
+            constrained |= 1 << i
+            for value in values:
+                value = normalize(value)
+                index[value] = index.get(value, 0) | (1 << i)
+        return index, self.all & ~constrained
+
+    def match_mask(self, listing):
+        """Bitmask of the subscriptions a listing satisfies."""
+        mask = self.all
+
+        if listing.price is not None and self._rent_limits:
+            mask &= self._rent_free | self._rent_masks[bisect.bisect_left(self._rent_limits, listing.price)]
+        if listing.area is not None and self._area_minimums:
+            mask &= self._area_free | self._area_masks[bisect.bisect_right(self._area_minimums, listing.area)]
+        if mask and self._types:
+            mask &= self._types_free | self._types.get(_normalize(listing.property_type), 0)
+        if mask and self._floors:
+            mask &= self._floors_free | self._floors.get(_normalize(listing.floor), 0)
+        if mask and self._postal:
+            postal = _postal(listing.postal_code)
+            allowed = self._postal_free
+            for length in self._postal_lengths:
+                allowed |= self._postal.get(postal[:length], 0)
+            mask &= allowed
+        if mask and self._keywords:
+            # Keywords match whole words or word prefixes of the street name
+            allowed = self._keywords_free
+            for word in _WORDS.findall(listing.street.lower()):
+                for end in range(1, min(len(word), self._keyword_max) + 1):
+                    allowed |= self._keywords.get(word[:end], 0)
+            mask &= allowed
+        return mask
+
+    def match(self, listing):
+        """The subscriptions a listing satisfies."""
+        mask = self.match_mask(listing)
+        return [self.subscriptions[i] for i in range(len(self.subscriptions)) if mask >> i & 1]
+
+
+def subscriptions_for(source_key, subscriptions):
+    """The subscriptions that apply to a source (those without "sources" apply to all)."""
+    return [s for s in subscriptions if not s.get('sources') or source_key in s['sources']]
+
+
+def server_side_payload(source, subscriptions):
+    """The source's API payload with the filters that every subscription shares pushed down.
+
+    Only bounds that all subscriptions of the source constrain can be pushed to
+    the API (using the loosest one), and only for fields the source maps in
+    its "server_filters". The exact rules are still applied client-side.
+    """
+    base_payload = source.get('base_payload', source['payload'])
+    server_fields = source.get('server_filters', {})
+    if not subscriptions or not server_fields:
+        return base_payload
+
+    conditions = []
+    if 'max_rent' in server_fields and all('max_rent' in s for s in subscriptions):
+        limit = max(s['max_rent'] for s in subscriptions)
+        conditions.append({server_fields['max_rent']: {'$lte': limit}})
+    if 'min_area' in server_fields and all('min_area' in s for s in subscriptions):
+        minimum = min(s['min_area'] for s in subscriptions)
+        conditions.append({server_fields['min_area']: {'$gte': minimum}})
+    if not conditions:
+        return base_payload
+
+    payload = copy.deepcopy(base_payload)
+    payload.setdefault('filters', {}).setdefault('$and', []).extend(conditions)
+    return payload
+
+
+def apply_subscriptions(sources, subscriptions):
+    """Attach each source's rule index and filtered payload.
+
+    A source without applicable subscriptions gets no rule index and notifies
+    every new listing.
+    """
+    for key, source in sources.items():
+        applicable = subscriptions_for(key, subscriptions)
+        source.setdefault('base_payload', source['payload'])
+        source['subscriptions'] = applicable
+        source['rule_index'] = RuleIndex(applicable) if applicable else None
+        source['payload'] = server_side_payload(source, applicable)
+
+
+def has_targets(source):
+    """Whether any webhook would receive notifications from a source."""
+    return bool(source['webhook_url'] or any(s.get('webhook') for s in source.get('subscriptions', ())))
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+import time
+
+from listing import parse_publication_date
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    source TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    link TEXT,
+    price REAL,
+    area REAL,
+    property_type TEXT,
+    img_url TEXT,
+    publication_date TEXT,
+    published_at REAL,
+    street TEXT,
+    house_number TEXT,
+    house_number_addition TEXT,
+    postal_code TEXT,
+    city TEXT,
+    floor TEXT,
+    house_type TEXT,
+    extra TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    removed_at REAL,
+    PRIMARY KEY (source, id)
+);
+CREATE INDEX IF NOT EXISTS listings_source_price ON listings (source, price);
+CREATE INDEX IF NOT EXISTS listings_price ON listings (price);
+CREATE INDEX IF NOT EXISTS listings_published_at ON listings (published_at);
+"""
+
+_UPSERT = """
+INSERT INTO listings (
+    source, id, title, link, price, area, property_type, img_url, publication_date, published_at,
+    street, house_number, house_number_addition, postal_code, city, floor, house_type, extra,
+    first_seen, last_seen, removed_at
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+ON CONFLICT (source, id) DO UPDATE SET
+    title = excluded.title,
+    link = excluded.link,
+    price = excluded.price,
+    area = excluded.area,
+    property_type = excluded.property_type,
+    img_url = excluded.img_url,
+    publication_date = excluded.publication_date,
+    published_at = excluded.published_at,
+    street = excluded.street,
+    house_number = excluded.house_number,
+    house_number_addition = excluded.house_number_addition,
+    postal_code = excluded.postal_code,
+    city = excluded.city,
+    floor = excluded.floor,
+    house_type = excluded.house_type,
+    extra = excluded.extra,
+    last_seen = excluded.last_seen,
+    removed_at = NULL
+"""
+
+
+def _row(listing, now):
+    published = parse_publication_date(listing.publication_date)
+    return (
+        listing.source, listing.id, listing.title, listing.link, listing.price, listing.area,
+        listing.property_type, listing.img_url, listing.publication_date,
+        published.timestamp() if published else None,
+        listing.street, listing.house_number, listing.house_number_addition, listing.postal_code,
+        listing.city, listing.floor, listing.house_type,
+        json.dumps(listing.extra, ensure_ascii=False) if listing.extra else None,
+        now, now
+    )
+
+
+def connect(path):
+    """Open the history database, creating the schema if needed."""
+    connection = sqlite3.connect(path)
+    # WAL lets the CLI read while the scraper writes; a lost last commit after a power cut is acceptable
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class ListingHistory:
+    """Every listing ever parsed, with first_seen, last_seen and removed_at, in SQLite.
+
+    All writes of a scrape cycle go into one transaction with batched
+    statements, so a cycle costs a single commit however many listings it saw.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = connect(path)
+
+    def record_cycle(self, source_key, listings, present_ids=(), removed_ids=(), timestamp=None):
+        """Store one cycle of a source.
+
+        `listings` are upserted with all their fields (clearing removed_at);
+        `present_ids` are IDs seen on unchanged pages, whose last_seen is
+        refreshed; `removed_ids` get their removed_at set.
+        """
+        now = timestamp or time.time()
+        parsed = {listing.id for listing in listings}
+        with self.connection:
+            self.connection.executemany(_UPSERT, [_row(listing, now) for listing in listings])
+            self.connection.executemany(
+                "UPDATE listings SET last_seen = ? WHERE source = ? AND id = ?",
+                [(now, source_key, listing_id) for listing_id in present_ids if listing_id not in parsed]
+            )
+            self.connection.executemany(
+                "UPDATE listings SET removed_at = ? WHERE source = ? AND id = ? AND removed_at IS NULL",
+                [(now, source_key, listing_id) for listing_id in removed_ids]
+            )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,157 @@
+"""Query the listing history recorded by scraper.py.
+
+    python history_cli.py summary
+    python history_cli.py market-time --by property_type
+    python history_cli.py prices --by city --source plaza
+    python history_cli.py busy-hours --top 10
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+from history import connect
+
+HISTORY_DB = os.getenv('HISTORY_DB', 'listings_history.db')
+
+# Columns listings can be grouped by; 'postcode' is the 4-digit postal district
+GROUPS = {
+    'source': 'source',
+    'city': 'city',
+    'postcode': 'substr(replace(postal_code, \' \', \'\'), 1, 4)',
+    'property_type': 'property_type',
+    'floor': 'floor'
+}
+
+WEEKDAYS = ('Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat')
+
+
+def _where(args, *conditions):
+    conditions = list(conditions)
+    params = []
+    if args.source:
+        conditions.append('source = ?')
+        params.append(args.source)
+    return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+
+def _quantile(ordered, fraction):
+    position = (len(ordered) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _table(headers, rows):
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[i]) for row in rows)) if rows else len(str(header))
+              for i, header in enumerate(headers)]
+    print('  '.join(f"{header:<{width}}" for header, width in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(f"{value:<{width}}" for value, width in zip(row, widths)))
+
+
+def summary(connection, args):
+    """Listings per source: total, still online, removed, first and last seen."""
+    where, params = _where(args)
+    rows = connection.execute(f"""
+        SELECT source, COUNT(*), SUM(removed_at IS NULL), SUM(removed_at IS NOT NULL),
+               MIN(first_seen), MAX(last_seen)
+        FROM listings{where} GROUP BY source ORDER BY source
+    """, params).fetchall()
+    _table(
+        ('source', 'listings', 'online', 'removed', 'first seen', 'last seen'),
+        [(source, total, online, removed,
+          time.strftime('%Y-%m-%d', time.localtime(first)), time.strftime('%Y-%m-%d %H:%M', time.localtime(last)))
+         for source, total, online, removed, first, last in rows]
+    )
+
+
+def market_time(connection, args):
+    """Time on market of removed listings: from publicationDate (or first seen) to removal."""
+    group = GROUPS[args.by]
+    where, params = _where(args, 'removed_at IS NOT NULL')
+    rows = connection.execute(f"""
+        SELECT {group} AS grp, (removed_at - COALESCE(published_at, first_seen)) / 86400.0 AS days
+        FROM listings{where} ORDER BY grp, days
+    """, params).fetchall()
+    table = []
+    for grp, days in itertools.groupby(rows, key=lambda row: row[0]):
+        ordered = [max(0.0, row[1]) for row in days]
+        table.append((grp or '-', len(ordered), f"{sum(ordered) / len(ordered):.1f}",
+                      f"{_quantile(ordered, 0.5):.1f}", f"{_quantile(ordered, 0.9):.1f}"))
+    _table((args.by, 'removed', 'avg days', 'median days', 'p90 days'), table)
+
+
+def prices(connection, args):
+    """Price distribution per group, and the median price per m²."""
+    group = GROUPS[args.by]
+    conditions = ['price IS NOT NULL']
+    if not args.all:
+        conditions.append('removed_at IS NULL')
+    where, params = _where(args, *conditions)
+    rows = connection.execute(f"""
+        SELECT {group} AS grp, price, price / NULLIF(area, 0) FROM listings{where} ORDER BY grp, price
+    """, params).fetchall()
+    table = []
+    for grp, group_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        group_rows = list(group_rows)
+        ordered = [row[1] for row in group_rows]
+        per_m2 = sorted(row[2] for row in group_rows if row[2] is not None)
+        table.append((
+            grp or '-', len(ordered),
+            *(f"€{_quantile(ordered, fraction):.0f}" for fraction in (0.0, 0.25, 0.5, 0.75, 1.0)),
+            f"€{_quantile(per_m2, 0.5):.2f}" if per_m2 else '-'
+        ))
+    _table((args.by, 'listings', 'min', 'p25', 'median', 'p75', 'max', 'median €/m²'), table)
+
+
+def busy_hours(connection, args):
+    """Hours of the week (UTC) in which most listings were published."""
+    where, params = _where(args, 'published_at IS NOT NULL')
+    rows = connection.execute(f"""
+        SELECT CAST(strftime('%w', published_at, 'unixepoch') AS INTEGER) AS weekday,
+               CAST(strftime('%H', published_at, 'unixepoch') AS INTEGER) AS hour, COUNT(*) AS published
+        FROM listings{where} GROUP BY weekday, hour ORDER BY published DESC LIMIT ?
+    """, params + [args.top]).fetchall()
+    _table(('weekday', 'hour (UTC)', 'published'),
+           [(WEEKDAYS[weekday], f"{hour:02d}:00", count) for weekday, hour, count in rows])
+
+
+COMMANDS = {
+    'summary': summary,
+    'market-time': market_time,
+    'prices': prices,
+    'busy-hours': busy_hours
+}
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', default=HISTORY_DB, help=f"history database (default: {HISTORY_DB})")
+    common.add_argument('--source', help='only listings of this source')
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('summary', parents=[common], help=summary.__doc__)
+    command = commands.add_parser('market-time', parents=[common], help=market_time.__doc__)
+    command.add_argument('--by', choices=GROUPS, default='source')
+    command = commands.add_parser('prices', parents=[common], help=prices.__doc__)
+    command.add_argument('--by', choices=GROUPS, default='city')
+    command.add_argument('--all', action='store_true', help='include removed listings')
+    command = commands.add_parser('busy-hours', parents=[common], help=busy_hours.__doc__)
+    command.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        sys.exit(f"No history database at {args.db}; run scraper.py first or pass --db")
+    connection = connect(args.db)
+    try:
+        COMMANDS[args.command](connection, args)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
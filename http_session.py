@@ -0,0 +1,70 @@
+import os
+
+import aiohttp
+
+from metrics import register_stats
+
+# Connection counters, updated by the trace hooks below
+CONNECTION_STATS = {
+    'opened': 0,
+    'reused': 0
+}
+register_stats('scraper_connections', CONNECTION_STATS, 'HTTP connections opened and reused from the pool')
+
+
+async def _on_connection_create_end(session, context, params):
+    CONNECTION_STATS['opened'] += 1
+
+
+async def _on_connection_reuseconn(session, context, params):
+    CONNECTION_STATS['reused'] += 1
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def create_session():
+    """Create the long-lived, connection-pooled session shared by all scrapers and notifiers.
+
+    Pool size, keep-alive, DNS caching and timeouts can be tuned through the
+    HTTP_* environment variables.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=_env_int('HTTP_POOL_LIMIT', 20),
+        limit_per_host=_env_int('HTTP_POOL_LIMIT_PER_HOST', 6),
+        use_dns_cache=True,
+        ttl_dns_cache=_env_int('HTTP_DNS_CACHE_TTL', 300),
+        keepalive_timeout=_env_float('HTTP_KEEPALIVE_TIMEOUT', 60.0)
+    )
+
+    timeout = aiohttp.ClientTimeout(
+        total=_env_float('HTTP_TOTAL_TIMEOUT', 60.0),
+        connect=_env_float('HTTP_CONNECT_TIMEOUT', 10.0),
+        sock_read=_env_float('HTTP_READ_TIMEOUT', 30.0)
+    )
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        trace_configs=[trace_config]
+    )
+
+
+def connection_stats_summary():
+    """Return a one-line summary of opened vs. reused connections."""
+    opened = CONNECTION_STATS['opened']
+    reused = CONNECTION_STATS['reused']
+    total = opened + reused
+    ratio = (reused / total * 100) if total else 0.0
+    return f"{opened} opened, {reused} reused ({ratio:.0f}% reuse)"
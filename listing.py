@@ -0,0 +1,71 @@
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+
+@dataclass(slots=True)
+class Listing:
+    """A normalized listing. Price and area are kept as numbers (None if unknown)."""
+
+    id: str
+    source: str
+    title: str
+    link: str
+    price: float | None = None
+    area: float | None = None
+    property_type: str = ''
+    img_url: str = ''
+    publication_date: str = ''
+    timestamp: float = 0.0
+    street: str = ''
+    house_number: str = ''
+    house_number_addition: str = ''
+    postal_code: str = ''
+    city: str = ''
+    floor: str = ''
+    house_type: str = ''
+    # Mapped fields without a dedicated attribute
+    extra: dict = field(default_factory=dict)
+
+
+def _normalize(text):
+    """Lowercase ASCII letters and digits, with runs of anything else as one space."""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text).split())
+
+
+def address_key(listing):
+    """Key of the dwelling a listing is for, the same on every source, or None without a full address.
+
+    Built from the postal code, street, house number and addition, so
+    spelling differences like "7514 AE" / "7514AE" or "K12" / "k 12" match.
+    The postal code is required: the same street name and number exist in
+    other cities.
+    """
+    number = _normalize(listing.house_number).replace(' ', '')
+    postal_code = _normalize(listing.postal_code).replace(' ', '')
+    if not number or not postal_code:
+        return None
+    street = _normalize(listing.street)
+    return f"{postal_code}|{street}|{number}|{_normalize(listing.house_number_addition).replace(' ', '')}"
+
+
+def format_price(price):
+    return f"€{price:.2f}" if price is not None else 'No price info'
+
+
+def format_area(area):
+    return f"{area:g} m²" if area is not None else 'No area info'
+
+
+def parse_publication_date(value):
+    """Parse an API publicationDate into an aware datetime, or None."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
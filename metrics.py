@@ -0,0 +1,218 @@
+import asyncio
+import bisect
+import json
+import os
+import time
+
+# Buckets (seconds) for the hot-path timers
+TIMER_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Buckets (seconds) for the time from a listing's publicationDate to its notification
+PUBLICATION_BUCKETS = (60, 120, 300, 600, 900, 1800, 3600, 7200, 14400, 43200, 86400)
+
+# Registered metrics and stats dicts, in registration order
+_metrics = []
+_stats = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager observing the seconds spent in its block."""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """The metric for one combination of label values (cache it on hot paths)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    @property
+    def family(self):
+        return f"{self.name}_total"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield f"{self.name}_total{_label_text(self.labelnames, values)} {child.value}"
+
+    def snapshot(self):
+        return {','.join(values): child.value for values, child in sorted(self._children.items())}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    @property
+    def family(self):
+        return self.name
+
+    def __init__(self, name, help, labels=(), buckets=TIMER_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), child.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, values)} {child.sum}"
+            yield f"{self.name}_count{_label_text(self.labelnames, values)} {child.count}"
+
+    def snapshot(self):
+        return {
+            ','.join(values): {
+                'count': child.count,
+                'sum': child.sum,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], child.counts))
+            }
+            for values, child in sorted(self._children.items())
+        }
+
+
+def register_stats(prefix, stats, help):
+    """Expose an existing module-level counter dict (e.g. FETCH_STATS) as <prefix>_<key>_total counters."""
+    _stats.append((prefix, stats, help))
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.family} {metric.help}")
+        lines.append(f"# TYPE {metric.family} {metric.kind}")
+        lines.extend(metric.samples())
+    for prefix, stats, help in _stats:
+        for key, value in stats.items():
+            lines.append(f"# HELP {prefix}_{key}_total {help}")
+            lines.append(f"# TYPE {prefix}_{key}_total counter")
+            lines.append(f"{prefix}_{key}_total {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """All metrics as a JSON-ready dict."""
+    data = {'timestamp': time.time()}
+    for metric in _metrics:
+        data[metric.name] = metric.snapshot()
+    for prefix, stats, _ in _stats:
+        for key, value in stats.items():
+            data[f"{prefix}_{key}"] = value
+    return data
+
+
+def dump_json(path):
+    """Write a snapshot of all metrics to `path`, atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def start_metrics_server(port, host='127.0.0.1'):
+    """Serve /metrics (Prometheus text) and /metrics.json. Returns the aiohttp runner."""
+    # The server side of aiohttp is only loaded when metrics are served
+    from aiohttp import web
+
+    async def prometheus(request):
+        return web.Response(text=render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def as_json(request):
+        return web.json_response(snapshot())
+
+    app = web.Application()
+    app.router.add_get('/metrics', prometheus)
+    app.router.add_get('/metrics.json', as_json)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def dump_periodically(path, interval=60):
+    """Dump a metrics snapshot to `path` every `interval` seconds, forever."""
+    while True:
+        await asyncio.sleep(interval)
+        dump_json(path)
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+
+from metrics import Histogram, register_stats
+
+logger = logging.getLogger(__name__)
+
+# Discord accepts up to 10 embeds and 6000 characters of embed text per message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2.0
+
+# Discord's answers for a deleted webhook or a wrong token: the webhook is dropped until the config reloads
+DEAD_WEBHOOK_STATUSES = (401, 404)
+
+# Longest a message waits for its thumbnails before it is sent with the original image URLs instead
+THUMBNAIL_WAIT = 2.0
+
+# Counters for delivered and failed notifications
+DISPATCH_STATS = {
+    'delivered': 0,
+    'failed': 0,
+    'messages': 0,
+    'rate_limited': 0,
+    'dropped': 0,
+    'thumbnails_late': 0
+}
+register_stats('scraper_dispatch', DISPATCH_STATS, 'Discord notification outcomes, see notifier.DISPATCH_STATS')
+
+NOTIFY_SECONDS = Histogram('scraper_notify_seconds', 'Time until Discord answers one webhook post, including 429 responses')
+
+
+def _embed_chars(embed):
+    """Characters Discord counts towards the per-message embed limit."""
+    total = len(embed.get('title', '')) + len(embed.get('description', ''))
+    total += len(embed.get('footer', {}).get('text', ''))
+    for field in embed.get('fields', []):
+        total += len(field.get('name', '')) + len(field.get('value', ''))
+    return total
+
+
+class _Notification:
+    __slots__ = ('key', 'embed', 'on_delivered', 'on_failed', 'on_dropped', 'thumbnail', 'deadline')
+
+    def __init__(self, key, embed, on_delivered, on_failed, on_dropped=None, thumbnail=None, deadline=None):
+        self.key = key
+        self.embed = embed
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self.on_dropped = on_dropped
+        # Prefetch task of the embed's thumbnail, and until when (monotonic) the message may wait for it
+        self.thumbnail = thumbnail
+        self.deadline = deadline
+
+
+class _WebhookLane:
+    """Queue, workers and rate-limit state of a single webhook."""
+
+    def __init__(self, url):
+        self.url = url
+        self.queue = asyncio.Queue()
+        self.blocked_until = 0.0
+        self.workers = []
+
+
+class NotificationDispatcher:
+    """Delivers Discord embeds through per-webhook queues and worker pools.
+
+    Notifications queued for the same webhook are batched up to 10 embeds per
+    message. Discord's X-RateLimit-* headers and 429 retry_after are honoured,
+    failed sends are retried with exponential backoff, and `on_delivered` is
+    only called once the message was accepted. After MAX_RETRIES failed
+    attempts `on_failed` is called instead. A webhook that answers 401 or 404
+    no longer exists: it is marked dead, and its queued and future
+    notifications call `on_dropped` without being sent, until `revive`.
+
+    With a Thumbnailer, the image of every embed is prefetched as soon as it
+    is queued and attached to the message as a thumbnail. A message waits at
+    most `thumbnail_wait` seconds after being queued for its thumbnails, and
+    keeps the original image URL for those that aren't ready by then.
+    """
+
+    def __init__(self, session, workers_per_webhook=2, max_retries=MAX_RETRIES, thumbnailer=None,
+                 thumbnail_wait=THUMBNAIL_WAIT):
+        self.session = session
+        self.workers_per_webhook = workers_per_webhook
+        self.max_retries = max_retries
+        self.thumbnailer = thumbnailer
+        self.thumbnail_wait = thumbnail_wait
+        self._lanes = {}
+        self._pending = set()
+        self._dead = set()
+
+    def is_dead(self, webhook_url):
+        """Whether a webhook answered that it doesn't exist."""
+        return webhook_url in self._dead
+
+    def revive(self):
+        """Try the dead webhooks again (after a config reload)."""
+        self._dead.clear()
+
+    def submit(self, webhook_url, key, embed, on_delivered=None, on_failed=None, on_dropped=None):
+        """Queue an embed dict for delivery. Returns False if `key` is already pending."""
+        if key in self._pending:
+            return False
+        self._pending.add(key)
+        notification = _Notification(key, embed, on_delivered, on_failed, on_dropped)
+        if self.thumbnailer and embed.get('image'):
+            notification.thumbnail = self.thumbnailer.prefetch(embed['image']['url'])
+            notification.deadline = time.monotonic() + self.thumbnail_wait
+        self._lane(webhook_url).queue.put_nowait(notification)
+        return True
+
+    async def join(self):
+        """Wait until every queued notification has been delivered or given up on."""
+        for lane in list(self._lanes.values()):
+            await lane.queue.join()
+
+    async def close(self):
+        """Stop all workers. Notifications still queued are not delivered."""
+        workers = [worker for lane in self._lanes.values() for worker in lane.workers]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._lanes.clear()
+
+    def _lane(self, webhook_url):
+        lane = self._lanes.get(webhook_url)
+        if lane is None:
+            lane = _WebhookLane(webhook_url)
+            lane.workers = [
+                asyncio.ensure_future(self._worker(lane)) for _ in range(self.workers_per_webhook)
+            ]
+            self._lanes[webhook_url] = lane
+        return lane
+
+    async def _next_batch(self, lane):
+        # Wait for one notification, then take whatever else is already queued
+        batch = [await lane.queue.get()]
+        chars = _embed_chars(batch[0].embed)
+        while len(batch) < MAX_EMBEDS_PER_MESSAGE and not lane.queue.empty():
+            notification = lane.queue.get_nowait()
+            size = _embed_chars(notification.embed)
+            if chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                # Doesn't fit: send it with the next batch
+                lane.queue.put_nowait(notification)
+                lane.queue.task_done()
+                break
+            batch.append(notification)
+            chars += size
+        return batch
+
+    async def _worker(self, lane):
+        while True:
+            batch = await self._next_batch(lane)
+            try:
+                await self._deliver(lane, batch)
+            except Exception as e:
+                # Keep the lane alive and let the callers know, so nothing stays pending forever
+                logger.exception("❌ Unexpected error sending %d Discord notification(s): %s", len(batch), e)
+                self._finish([notification for notification in batch if notification.key in self._pending],
+                             delivered=False)
+            finally:
+                for _ in batch:
+                    lane.queue.task_done()
+
+    async def _thumbnails(self, batch):
+        """The embeds of a batch, with the image of each one whose thumbnail is ready in time attached.
+
+        Returns (embeds, files) with files a list of (filename, JPEG bytes).
+        """
+        waiting = [notification for notification in batch if notification.thumbnail]
+        if not waiting:
+            return [notification.embed for notification in batch], []
+        # The tasks are shared between webhooks, so they are waited for but never cancelled here
+        timeout = max(0.0, min(notification.deadline for notification in waiting) - time.monotonic())
+        done, late = await asyncio.wait({notification.thumbnail for notification in waiting}, timeout=timeout)
+        DISPATCH_STATS['thumbnails_late'] += len(late)
+
+        embeds, files = [], []
+        for notification in batch:
+            embed = notification.embed
+            task = notification.thumbnail
+            thumbnail = None
+            if task in done and not task.cancelled() and task.exception() is None:
+                thumbnail = task.result()
+            if thumbnail:
+                filename, data = thumbnail
+                if filename not in (name for name, _ in files):
+                    files.append((filename, data))
+                # Embeds are shared between webhooks: attach to a copy
+                embed = dict(embed, image={'url': f"attachment://{filename}"})
+            embeds.append(embed)
+        return embeds, files
+
+    def _body(self, payload, files):
+        """Request arguments for a webhook post: plain JSON, or multipart with the attached files."""
+        if not files:
+            return {'json': payload}
+        payload = dict(payload, attachments=[
+            {'id': index, 'filename': filename} for index, (filename, _) in enumerate(files)
+        ])
+        form = aiohttp.FormData()
+        form.add_field('payload_json', json.dumps(payload), content_type='application/json')
+        for index, (filename, data) in enumerate(files):
+            form.add_field(f"files[{index}]", data, filename=filename, content_type='image/jpeg')
+        return {'data': form}
+
+    async def _deliver(self, lane, batch):
+        if lane.url in self._dead:
+            self._finish(batch, delivered=False, dropped=True)
+            return
+        embeds, files = await self._thumbnails(batch)
+        payload = {'embeds': embeds}
+        attempt = 0
+        while True:
+            wait = lane.blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            attempt += 1
+            start = time.perf_counter()
+            try:
+                # A multipart body can only be sent once, so it is built for every attempt
+                async with self.session.post(lane.url, **self._body(payload, files)) as response:
+                    NOTIFY_SECONDS.observe(time.perf_counter() - start)
+                    self._update_rate_limit(lane, response)
+
+                    if response.status == 429:
+                        DISPATCH_STATS['rate_limited'] += 1
+                        retry_after = await self._retry_after(response)
+                        lane.blocked_until = max(lane.blocked_until, time.monotonic() + retry_after)
+                        # Rate limiting is not a failure of this batch; try again once unblocked
+                        attempt -= 1
+                        continue
+
+                    if response.status in (200, 204):
+                        DISPATCH_STATS['messages'] += 1
+                        self._finish(batch, delivered=True)
+                        return
+
+                    error = f"status code {response.status}: {(await response.text(errors='replace'))[:200]}"
+                    if response.status in DEAD_WEBHOOK_STATUSES:
+                        self._dead.add(lane.url)
+                        logger.error("❌ Discord webhook is gone (%s), dropping it until the config is reloaded",
+                                     error)
+                        self._finish(batch, delivered=False, dropped=True)
+                        return
+                    if 400 <= response.status < 500:
+                        # The request itself is bad; retrying won't help
+                        attempt = self.max_retries
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt >= self.max_retries:
+                logger.error("❌ Giving up on %d Discord notification(s) after %d attempts: %s",
+                             len(batch), attempt, error)
+                self._finish(batch, delivered=False)
+                return
+
+            delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            logger.warning("⚠️  Discord notification failed (%s), retrying in %.0f seconds", error, delay)
+            await asyncio.sleep(delay)
+
+    def _update_rate_limit(self, lane, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset_after = response.headers.get('X-RateLimit-Reset-After')
+        if remaining == '0' and reset_after:
+            try:
+                lane.blocked_until = max(lane.blocked_until, time.monotonic() + float(reset_after))
+            except ValueError:
+                pass
+
+    async def _retry_after(self, response):
+        try:
+            body = await response.json(content_type=None)
+            return float(body['retry_after'])
+        except (ValueError, KeyError, TypeError, aiohttp.ContentTypeError):
+            pass
+        try:
+            return float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            return 1.0
+
+    def _finish(self, batch, delivered, dropped=False):
+        for notification in batch:
+            self._pending.discard(notification.key)
+            if dropped:
+                callback = notification.on_dropped
+                DISPATCH_STATS['dropped'] += 1
+            elif delivered:
+                callback = notification.on_delivered
+                DISPATCH_STATS['delivered'] += 1
+            else:
+                callback = notification.on_failed
+                DISPATCH_STATS['failed'] += 1
+            if callback:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.exception("❌ Error in notification callback: %s", e)
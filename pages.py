@@ -0,0 +1,91 @@
+import logging
+import time
+
+from fetcher import iter_pages, forget_pages
+from metrics import Counter, Histogram
+from sources import parse_item
+
+logger = logging.getLogger(__name__)
+
+# Headers to mimic a browser request
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36',
+    'Accept': 'application/json',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Content-Type': 'application/json'
+}
+
+PARSE_SECONDS = Histogram('scraper_parse_seconds', 'Time to parse the items of one API page', ['source'])
+LISTINGS = Counter(
+    'scraper_listings',
+    'Listings by outcome: new, known, pending, filtered, duplicate, invalid, changed, relisted or removed',
+    ['source', 'status']
+)
+
+
+async def iter_listing_pages(session, scraper_name, scraper_config):
+    """Yield the parsed listings of each API page as soon as that page arrives.
+
+    Yields (page, listings), with listings None for pages that are unchanged
+    since the previous cycle.
+    """
+    headers = HEADERS.copy()
+    headers.update(scraper_config['headers'])
+    
+    logger.info("%s Fetching %s listings...", scraper_config['emoji'], scraper_config['name'])
+    
+    parse_seconds = PARSE_SECONDS.labels(scraper_name)
+    invalid = LISTINGS.labels(scraper_name, 'invalid')
+    pages = iter_pages(
+        session,
+        scraper_config['api_url'],
+        scraper_config['payload'],
+        headers,
+        page_size=scraper_config['page_size'],
+        sort=scraper_config['sort'],
+        max_pages=scraper_config['max_pages'],
+        source=scraper_name
+    )
+    try:
+        async for page, items in pages:
+            if items is None:
+                logger.debug("%s API page %d unchanged, skipping", scraper_config['name'], page)
+                yield page, None
+                continue
+            
+            logger.debug("%s API page %d returned %d items", scraper_config['name'], page, len(items))
+        
+            # One timestamp for the whole page
+            timestamp = time.time()
+            start = time.perf_counter()
+            listings = []
+            for item in items:
+                try:
+                    listing = parse_item(scraper_config, item, timestamp)
+                except Exception as e:
+                    logger.warning("Error processing %s listing: %s", scraper_config['name'], e)
+                    invalid.inc()
+                    continue
+                if listing:
+                    listings.append(listing)
+            parse_seconds.observe(time.perf_counter() - start)
+        
+            yield page, listings
+    finally:
+        # Cancel any look-ahead page requests if the caller stopped early
+        await pages.aclose()
+
+
+class LocalPages:
+    """Walks sources in this process; shards.ShardPool does the same in worker processes."""
+
+    def walk(self, session, scraper_name, scraper_config):
+        """Async iterator over (page, listings), see iter_listing_pages."""
+        return iter_listing_pages(session, scraper_name, scraper_config)
+
+    def forget(self, api_url):
+        """Make the next walk of an endpoint parse every page again."""
+        forget_pages(api_url)
+
+
+LOCAL_PAGES = LocalPages()
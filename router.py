@@ -0,0 +1,105 @@
+class _FanOut:
+    """Delivery state of one listing across its webhooks."""
+
+    __slots__ = ('targets', 'remaining', 'failed', 'on_delivered', 'on_failed')
+
+    def __init__(self, targets, on_delivered, on_failed):
+        self.targets = targets
+        self.remaining = set(targets)
+        self.failed = False
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+
+
+class Router:
+    """Fans new listings out to the webhooks of the subscriptions they match.
+
+    The embed is built once per listing and queued on the dispatcher for every
+    target webhook; the dispatcher gives each webhook its own queue and
+    rate-limit state, so a slow or failing webhook doesn't hold up the others.
+    `on_delivered` runs once every target has the notification, with the set
+    of webhooks that received it (over every attempt). If a target
+    fails, `on_failed` runs instead and the webhooks that did receive it are
+    remembered, so routing the listing again only retries the failed ones.
+    Notifications are tracked per listing and `kind` of event, so a change
+    notification doesn't collide with the listing's own. Webhooks the
+    dispatcher found dead are left out, and one that dies during the fan-out
+    counts as done, so a deleted webhook doesn't hold its listings back.
+    """
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self._fanouts = {}
+        self._delivered = {}
+
+    def targets(self, source, listing):
+        """Webhook URLs a listing should go to: one per matching subscription, deduplicated."""
+        rule_index = source.get('rule_index')
+        if rule_index is None:
+            webhook_url = source['webhook_url']
+            return [webhook_url] if webhook_url and not self.dispatcher.is_dead(webhook_url) else []
+
+        targets = []
+        for subscription in rule_index.match(listing):
+            url = subscription.get('webhook') or source['webhook_url']
+            if url and url not in targets and not self.dispatcher.is_dead(url):
+                targets.append(url)
+        return targets
+
+    def is_pending(self, source_key, listing_id, kind='added'):
+        return (source_key, listing_id, kind) in self._fanouts
+
+    def sending(self, source_key, listing_id, kind='added'):
+        """Webhooks a pending notification is queued for or was already delivered to; empty if none is pending."""
+        key = (source_key, listing_id, kind)
+        fanout = self._fanouts.get(key)
+        if fanout is None:
+            return set()
+        return set(fanout.targets) | self._delivered.get(key, set())
+
+    def route(self, source, listing, build_embed, on_delivered=None, on_failed=None, kind='added', exclude=()):
+        """Queue a listing for all its targets but `exclude`. Returns the number of webhooks it was queued for."""
+        key = (source['key'], listing.id, kind)
+        if key in self._fanouts:
+            return 0
+
+        delivered = self._delivered.get(key, ())
+        targets = [url for url in self.targets(source, listing) if url not in delivered and url not in exclude]
+        if not targets:
+            self._delivered.pop(key, None)
+            return 0
+
+        fanout = _FanOut(targets, on_delivered, on_failed)
+        self._fanouts[key] = fanout
+        embed = build_embed(listing, source)
+        for url in targets:
+            self.dispatcher.submit(
+                url,
+                (key, url),
+                embed,
+                on_delivered=lambda url=url: self._target_done(key, url, True),
+                on_failed=lambda url=url: self._target_done(key, url, False),
+                on_dropped=lambda url=url: self._target_done(key, url, True, dropped=True)
+            )
+        return len(targets)
+
+    def _target_done(self, key, url, delivered, dropped=False):
+        fanout = self._fanouts[key]
+        fanout.remaining.discard(url)
+        if delivered:
+            # A dead webhook counts as done, but it never received the notification
+            if not dropped:
+                self._delivered.setdefault(key, set()).add(url)
+        else:
+            fanout.failed = True
+        if fanout.remaining:
+            return
+
+        del self._fanouts[key]
+        if fanout.failed:
+            if fanout.on_failed:
+                fanout.on_failed()
+        else:
+            delivered = self._delivered.pop(key, set())
+            if fanout.on_delivered:
+                fanout.on_delivered(delivered)
@@ -1,3 +1,4 @@
 #!/bin/bash
 cd /home/ubuntu/Plaza-Apartment-scraper
-python3 scraper.py 
\ No newline at end of file
+# exec: pm2's stop signal goes straight to the scraper, which shuts down gracefully
+exec python3 scraper.py 
\ No newline at end of file
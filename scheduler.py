@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+
+from fetcher import FetchError, CircuitOpenError
+from listing import parse_publication_date
+
+logger = logging.getLogger(__name__)
+
+# An hour-of-week bucket counts as busy once it holds this many times the
+# average number of publications, and at least BUSY_MIN_PUBLICATIONS
+BUSY_FACTOR = 2.0
+BUSY_MIN_PUBLICATIONS = 3
+
+HOURS_PER_WEEK = 7 * 24
+
+# First retry delay after a failure, doubled on every further failure
+ERROR_RETRY_DELAY = 60
+
+
+def _hour_of_week(dt):
+    dt = dt.astimezone(timezone.utc)
+    return dt.weekday() * 24 + dt.hour
+
+
+class SourceSchedule:
+    """Polling interval of a single source.
+
+    Polls every `interval` seconds, or every `busy_interval` seconds during
+    hours of the week in which listings were historically published. Failures
+    back off exponentially up to `max_backoff` (or follow the server's
+    Retry-After), and every delay gets +/- `jitter` randomisation. While the
+    source's circuit breaker is open, polls wait for its next probe.
+    """
+
+    def __init__(self, interval, busy_interval=None, max_backoff=3600, jitter=0.1):
+        self.interval = interval
+        self.busy_interval = busy_interval or interval
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.failures = 0
+        self.retry_after = None
+        self.paused = None
+        self._publications = [0] * HOURS_PER_WEEK
+        self._counted_ids = set()
+        self._updated = asyncio.Event()
+
+    def observe(self, listing):
+        """Learn from a listing's publicationDate; each listing is counted once."""
+        if listing.id in self._counted_ids:
+            return
+        published = parse_publication_date(listing.publication_date)
+        if published is None:
+            return
+        self._counted_ids.add(listing.id)
+        self._publications[_hour_of_week(published)] += 1
+
+    def is_busy(self, now=None):
+        """Whether `now` falls in an hour of the week with many past publications."""
+        total = len(self._counted_ids)
+        if not total:
+            return False
+        count = self._publications[_hour_of_week(now or datetime.now(timezone.utc))]
+        return count >= BUSY_MIN_PUBLICATIONS and count >= BUSY_FACTOR * total / HOURS_PER_WEEK
+
+    def update(self, interval, busy_interval=None):
+        """Change the intervals, e.g. after a config reload. A pending sleep is recomputed."""
+        busy_interval = busy_interval or interval
+        if (interval, busy_interval) != (self.interval, self.busy_interval):
+            self.interval = interval
+            self.busy_interval = busy_interval
+            self._updated.set()
+
+    async def sleep(self, delay):
+        """Sleep `delay` seconds, or a freshly computed delay if the intervals change meanwhile."""
+        start = time.monotonic()
+        deadline = start + delay
+        self._updated.clear()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._updated.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+            self._updated.clear()
+            deadline = start + self.next_delay()
+
+    def record_success(self):
+        self.failures = 0
+        self.retry_after = None
+        self.paused = None
+
+    def record_failure(self, retry_after=None):
+        self.failures += 1
+        self.retry_after = retry_after
+        self.paused = None
+
+    def record_paused(self, seconds):
+        """The source's circuit breaker is open: wait until it lets a probe through."""
+        self.paused = seconds
+
+    def next_delay(self, now=None):
+        """Seconds to wait before the next poll."""
+        if self.paused:
+            # Never wake before the probe is allowed
+            return max(1.0, self.paused * random.uniform(1, 1 + self.jitter))
+        if self.failures:
+            base = min(self.interval, ERROR_RETRY_DELAY)
+            delay = min(self.max_backoff, base * 2 ** (self.failures - 1))
+            if self.retry_after:
+                delay = max(delay, self.retry_after)
+        elif self.is_busy(now):
+            delay = self.busy_interval
+        else:
+            delay = self.interval
+        return max(1.0, delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+async def run_source(label, schedule, poll):
+    """Call `poll()` forever, sleeping according to `schedule` between calls."""
+    while True:
+        try:
+            await poll()
+            schedule.record_success()
+        except CircuitOpenError as e:
+            schedule.record_paused(e.retry_after)
+            logger.warning("⏸️  %s: %s", label, e)
+        except FetchError as e:
+            schedule.record_failure(retry_after=e.retry_after)
+            logger.error("❌ %s: %s", label, e)
+        except Exception as e:
+            schedule.record_failure()
+            logger.exception("❌ Error polling %s: %s", label, e)
+
+        delay = schedule.next_delay()
+        if schedule.paused:
+            mode = 'circuit breaker open'
+        else:
+            mode = 'backoff' if schedule.failures else ('busy window' if schedule.is_busy() else 'normal')
+        logger.info("⏰ %s: next check in %.0f seconds (%s) at %s",
+                    label, delay, mode, time.strftime('%H:%M:%S', time.localtime(time.time() + delay)))
+        await schedule.sleep(delay)
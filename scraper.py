@@ -1,519 +1,630 @@
 import os
 import time
-import json
-import requests
+import logging
 from dotenv import load_dotenv
-import discord
-from discord import Webhook
-import aiohttp
 import asyncio
-import re
-import traceback
-import urllib.parse
+import signal
+
+from http_session import create_session, connection_stats_summary
+from fetcher import enable_recording, FETCH_STATS, SORT_BY_PUBLICATION_DATE
+from seen_store import SeenStore
+from scheduler import SourceSchedule, run_source
+from notifier import NotificationDispatcher, DISPATCH_STATS
+from sources import load_config, ConfigWatcher
+from pages import LISTINGS, LOCAL_PAGES
+from listing import format_price, format_area, parse_publication_date
+from filters import has_targets
+from router import Router
+from changes import ChangeTracker, ListingEvent, apply_event, ADDED, CHANGED, REMOVED
+from dwellings import DwellingIndex, webhook_digest
+from logs import setup_logging
+from metrics import (Counter, Histogram, register_stats, start_metrics_server, dump_periodically,
+                     PUBLICATION_BUCKETS)
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger('scraper')
+
 # Constants
-CHECK_INTERVAL = 1500  # 5 minutes
-
-# Discord webhook URLs
-PLAZA_WEBHOOK_URL = os.getenv('PLAZA_WEBHOOK_URL')
-ROOMSPOT_WEBHOOK_URL = os.getenv('ROOMSPOT_WEBHOOK_URL')
-
-# Scraper configurations
-SCRAPERS = {
-    'plaza': {
-        'name': 'Plaza',
-        'api_url': "https://mosaic-plaza-aanbodapi.zig365.nl/api/v1/actueel-aanbod?limit=60&locale=en_GB&page=0&sort=%2BreactionData.aangepasteTotaleHuurprijs",
-        'webhook_url': PLAZA_WEBHOOK_URL,
-        'base_url': 'https://plaza.newnewnew.space',
-        'color': discord.Color.blue(),
-        'emoji': '🏢',
-        'seen_file': 'seen_listings_plaza.json'
-    },
-    'roomspot': {
-        'name': 'Roomspot',
-        'api_url': "https://studentenenschede-aanbodapi.zig365.nl/api/v1/actueel-aanbod?limit=60&locale=en_GB&page=0&sort=%2BreactionData.aangepasteTotaleHuurprijs",
-        'webhook_url': ROOMSPOT_WEBHOOK_URL,
-        'base_url': 'https://www.roomspot.nl',
-        'color': discord.Color.green(),
-        'emoji': '🏠',
-        'seen_file': 'seen_listings_roomspot.json'
-    }
-}
+SEEN_TTL_DAYS = int(os.getenv('SEEN_TTL_DAYS', '90'))
 
-# API payloads for each scraper
-PLAZA_PAYLOAD = {
-    "filters": {
-        "$and": [
-            {
-                "$and": [
-                    {"municipality.id": {"$eq": "15897"}},  # Enschede municipality ID
-                    {"regio.id": {"$eq": "9"}},            # Overijssel region ID
-                    {"land.id": {"$eq": "524"}}            # Netherlands country ID
-                ]
-            }
-        ]
-    },
-    "hidden-filters": {
-        "$and": [
-            {"dwellingType.categorie": {"$eq": "woning"}},
-            {"rentBuy": {"$eq": "Huur"}},
-            {"isExtraAanbod": {"$eq": ""}},
-            {"isWoningruil": {"$eq": ""}},
-            {
-                "$and": [
-                    {
-                        "$or": [
-                            {"street": {"$like": ""}},
-                            {"houseNumber": {"$like": ""}},
-                            {"houseNumberAddition": {"$like": ""}}
-                        ]
-                    },
-                    {
-                        "$or": [
-                            {"street": {"$like": ""}},
-                            {"houseNumber": {"$like": ""}},
-                            {"houseNumberAddition": {"$like": ""}}
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
+# Source definitions, see sources.json
+SOURCES_FILE = os.getenv('SOURCES_FILE', 'sources.json')
+
+# SQLite database every parsed listing is recorded in (see history_cli.py); empty to disable
+HISTORY_DB = os.getenv('HISTORY_DB', 'listings_history.db')
+
+# Record raw API responses here (for bench/replay_server.py) when set
+RECORD_DIR = os.getenv('RECORD_DIR')
+
+# How many sources may be scraped at the same time
+MAX_CONCURRENT_SOURCES = int(os.getenv('MAX_CONCURRENT_SOURCES', '4'))
+
+# Logging: level, and 'text' or 'json' lines
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+# Serve Prometheus metrics on http://127.0.0.1:<METRICS_PORT>/metrics when set
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Dump a JSON metrics snapshot to this file every METRICS_DUMP_INTERVAL seconds when set
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_DUMP_INTERVAL = int(os.getenv('METRICS_DUMP_INTERVAL', '60'))
+
+# Attach downscaled listing images to notifications when set (needs Pillow), cached in this directory up to
+# THUMBNAIL_CACHE_MB; at most THUMBNAIL_CONCURRENCY images are fetched at a time, and a notification waits at most
+# THUMBNAIL_WAIT seconds for its thumbnail before it goes out with the original image URL
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR')
+THUMBNAIL_CACHE_MB = int(os.getenv('THUMBNAIL_CACHE_MB', '100'))
+THUMBNAIL_CONCURRENCY = int(os.getenv('THUMBNAIL_CONCURRENCY', '4'))
+THUMBNAIL_WAIT = float(os.getenv('THUMBNAIL_WAIT', '2'))
+
+# Announce a dwelling listed on several sources (same address) once per webhook, with links to every source;
+# set to 0 to announce each source's listing separately
+DEDUPE_DWELLINGS = os.getenv('DEDUPE_DWELLINGS', '1') != '0'
+
+# Fetch and parse sources in this many worker processes (see shards.py); 0 to do everything in this process
+WORKERS = int(os.getenv('WORKERS', '0'))
+
+# Seconds to keep delivering queued notifications after SIGTERM/SIGINT before exiting anyway
+SHUTDOWN_GRACE = float(os.getenv('SHUTDOWN_GRACE', '10'))
+
+# How often (seconds) sources.json and .env are checked for changes, which are applied without a restart
+CONFIG_POLL_INTERVAL = float(os.getenv('CONFIG_POLL_INTERVAL', '5'))
+
+# Scrape cycles per source, and how many of them were short-circuited because
+# every page was unchanged since the previous cycle
+CYCLE_STATS = {
+    'cycles': 0,
+    'cycles_short_circuited': 0
 }
+register_stats('scraper_cycle', CYCLE_STATS, 'Scrape cycles, see scraper.CYCLE_STATS')
 
-ROOMSPOT_PAYLOAD = {
-    "hidden-filters": {
-        "$and": [
-            {"dwellingType.categorie": {"$eq": "woning"}},
-            {"rentBuy": {"$eq": "Huur"}},
-            {"isExtraAanbod": {"$eq": ""}},
-            {"isWoningruil": {"$eq": ""}},
-            {
-                "$and": [
-                    {
-                        "$or": [
-                            {"street": {"$like": ""}},
-                            {"houseNumber": {"$like": ""}},
-                            {"houseNumberAddition": {"$like": ""}}
-                        ]
-                    },
-                    {
-                        "$or": [
-                            {"street": {"$like": ""}},
-                            {"houseNumber": {"$like": ""}},
-                            {"houseNumberAddition": {"$like": ""}}
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
+DIFF_SECONDS = Histogram('scraper_diff_seconds', 'Time to diff one page of listings against the seen store', ['source'])
+CYCLE_SECONDS = Histogram('scraper_cycle_seconds', 'Duration of a complete scrape cycle', ['source'])
+NOTIFICATIONS = Counter('scraper_notifications', 'Listing notifications delivered or failed', ['source', 'result'])
+PUBLICATION_TO_NOTIFICATION_SECONDS = Histogram(
+    'scraper_publication_to_notification_seconds',
+    'Time from a listing\'s publicationDate until every webhook has its notification',
+    ['source'],
+    buckets=PUBLICATION_BUCKETS
+)
+
+# Log icons per listing event status
+EVENT_ICONS = {
+    'new': '🆕',
+    'relisted': '🔁',
+    'changed': '✏️',
+    'removed': '🗑️'
 }
 
-# Headers to mimic a browser request
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36',
-    'Accept': 'application/json',
-    'Accept-Language': 'en-US,en;q=0.9',
-    'Content-Type': 'application/json'
+# How changed listing attributes are named in notifications
+CHANGE_LABELS = {
+    'price': 'Price',
+    'area': 'Area',
+    'property_type': 'Property Type',
+    'img_url': 'Image'
 }
 
-async def get_plaza_listings():
-    """Fetch listings from the Plaza API."""
-    listings = []
+def _field(name, value, inline=True):
+    return {'name': name, 'value': str(value), 'inline': inline}
+
+def build_embed(listing, source_config, event=None):
+    """Build the Discord embed (as a JSON-ready dict) for a listing event (default: a new listing)."""
+    name = source_config['name']
+    if event and event.relisted:
+        title = f"🔁 {name} Listing Back Online!"
+    elif event is None or event.kind == ADDED:
+        title = f"{source_config['emoji']} New {name} Listing!"
+    elif event.kind == CHANGED:
+        title = f"✏️ {name} Listing Changed"
+    else:
+        title = f"🗑️ {name} Listing Withdrawn"
     
-    try:
-        print("🏢 Fetching Plaza listings...")
-        async with aiohttp.ClientSession() as session:
-            headers = HEADERS.copy()
-            headers.update({
-                'Referer': 'https://plaza.newnewnew.space/en/availables-places/living-place',
-                'Origin': 'https://plaza.newnewnew.space'
-            })
-            
-            async with session.post(
-                SCRAPERS['plaza']['api_url'], 
-                headers=headers,
-                json=PLAZA_PAYLOAD
-            ) as response:
-                if response.status != 200:
-                    print(f"Error: Plaza API returned status code {response.status}")
-                    return listings
-                
-                data = await response.json()
-                
-                if data and 'data' in data:
-                    items = data['data']
-                    print(f"Plaza API returned {len(items)} items")
-                    
-                    for item in items:
-                        try:
-                            listing_id = str(item.get('id', ''))
-                            
-                            # Extract address components
-                            street = item.get('street', '')
-                            house_number = item.get('houseNumber', '')
-                            house_number_addition = item.get('houseNumberAddition', '')
-                            
-                            # Get city info
-                            city_name = ''
-                            if isinstance(item.get('city'), dict):
-                                city_name = item['city'].get('name', '')
-                            else:
-                                city_name = item.get('city', '')
-                            
-                            postal_code = item.get('postalcode', '')
-                            
-                            # Format the title
-                            title_parts = [p for p in [street, house_number, house_number_addition] if p]
-                            title = f"{' '.join(title_parts)}"
-                            if postal_code or city_name:
-                                title += f", {postal_code} {city_name}".strip()
-                            
-                            # Extract other details
-                            price = ''
-                            if item.get('totalRent'):
-                                price = f"€{float(item['totalRent']):.2f}"
-                            elif item.get('netRent'):
-                                price = f"€{float(item['netRent']):.2f}"
-                            else:
-                                price = 'No price info'
-                            
-                            area = ''
-                            if item.get('areaDwelling'):
-                                area = f"{item['areaDwelling']} m²"
-                            else:
-                                area = 'No area info'
-                            
-                            property_type = ''
-                            if isinstance(item.get('dwellingType'), dict):
-                                property_type = item['dwellingType'].get('name', '')
-                            else:
-                                property_type = item.get('objectType', '')
-                            
-                            floor = ''
-                            if isinstance(item.get('floor'), dict):
-                                floor = item['floor'].get('name', '')
-                            
-                            # Extract image URL
-                            img_url = ''
-                            if item.get('pictures') and len(item['pictures']) > 0:
-                                if isinstance(item['pictures'][0], dict) and 'url' in item['pictures'][0]:
-                                    img_url = item['pictures'][0]['url']
-                                elif isinstance(item['pictures'][0], dict) and 'uri' in item['pictures'][0]:
-                                    img_url = item['pictures'][0]['uri']
-                            
-                            if img_url and not img_url.startswith(('http://', 'https://')):
-                                img_url = f"https://plaza.newnewnew.space{img_url}"
-                            
-                            # Create link
-                            cleaned_title = re.sub(r'[^a-z0-9]', '-', title.lower())
-                            cleaned_title = re.sub(r'-+', '-', cleaned_title).strip('-')
-                            
-                            link = f"https://plaza.newnewnew.space/en/availables-places/living-place/details/{listing_id}"
-                            if cleaned_title:
-                                link += f"-{cleaned_title}"
-                            
-                            if not title or title.isspace():
-                                continue
-                            
-                            listing = {
-                                'id': listing_id,
-                                'title': title,
-                                'price': price,
-                                'area': area,
-                                'property_type': property_type,
-                                'floor': floor,
-                                'link': link,
-                                'img_url': img_url,
-                                'publication_date': item.get('publicationDate', ''),
-                                'timestamp': time.time(),
-                                'source': 'plaza'
-                            }
-                            
-                            listings.append(listing)
-                            
-                        except Exception as e:
-                            print(f"Error processing Plaza listing: {e}")
-                            continue
-                    
-                    print(f"Found {len(listings)} Plaza listings")
-        
-    except Exception as e:
-        print(f"Error fetching Plaza listings: {e}")
+    # Add fields with details
+    price = format_price(listing.price)
+    if event and event.kind == CHANGED and 'price' in event.changes:
+        price = f"{format_price(event.previous_price)} → {price}"
+    fields = [
+        _field("Price", price),
+        _field("Area", format_area(listing.area)),
+        _field("Property Type", listing.property_type)
+    ]
+    
+    if listing.floor:
+        fields.append(_field("Floor", listing.floor))
+    
+    if listing.house_type:
+        fields.append(_field("House Type", listing.house_type))
     
-    return listings
+    if event and event.kind == CHANGED and event.changes:
+        fields.append(_field("Changed", ', '.join(CHANGE_LABELS[c] for c in event.changes), inline=False))
+    
+    if event and event.also_on:
+        links = ' • '.join(f"[{other}]({link})" for other, link in event.also_on)
+        fields.append(_field("Also on", links, inline=False))
+    
+    embed = {
+        'type': 'rich',
+        'title': title,
+        'description': f"**{listing.title}**",
+        'url': listing.link,
+        'color': source_config['color'],
+        'fields': fields,
+        # Footer with timestamp and source
+        'footer': {'text': f"{name} • {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(listing.timestamp))}"}
+    }
+    
+    # Add image if available (a withdrawn listing's image is usually gone too)
+    if listing.img_url and not (event and event.kind == REMOVED):
+        embed['image'] = {'url': listing.img_url}
+    
+    return embed
+
+def route_event(router, event, scraper_config, seen_listings, page_source=LOCAL_PAGES, exclude=()):
+    """Fan a listing event out to its webhooks; it is recorded in the seen store once every webhook has it.
 
-async def get_roomspot_listings():
-    """Fetch listings from the Roomspot API."""
-    listings = []
+    Webhooks in `exclude` are skipped. Returns the number of webhooks the event was queued for.
+    """
+    source = scraper_config['key']
+    listing = event.listing
     
-    try:
-        print("🏠 Fetching Roomspot listings...")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                SCRAPERS['roomspot']['api_url'], 
-                headers=HEADERS,
-                json=ROOMSPOT_PAYLOAD
-            ) as response:
-                if response.status != 200:
-                    print(f"Error: Roomspot API returned status code {response.status}")
-                    return listings
-                
-                data = await response.json()
-                
-                if data and 'data' in data:
-                    items = data['data']
-                    print(f"Roomspot API returned {len(items)} items")
-                    
-                    for item in items:
-                        try:
-                            listing_id = str(item.get('id', ''))
-                            
-                            # Extract address components
-                            street = item.get('street', '')
-                            house_number = item.get('houseNumber', '')
-                            house_number_addition = item.get('houseNumberAddition', '')
-                            
-                            city_name = item.get('gemeenteGeoLocatieNaam', '')
-                            postal_code = item.get('postalcode', '')
-                            
-                            # Format the title
-                            title_parts = [p for p in [street, house_number, house_number_addition] if p]
-                            title = f"{' '.join(title_parts)}"
-                            if postal_code or city_name:
-                                title += f", {postal_code} {city_name}".strip()
-                            
-                            # Extract other details
-                            price = ''
-                            if item.get('totalRent'):
-                                price = f"€{float(item['totalRent']):.2f}"
-                            elif item.get('netRent'):
-                                price = f"€{float(item['netRent']):.2f}"
-                            else:
-                                price = 'No price info'
-                            
-                            area = ''
-                            if item.get('areaDwelling'):
-                                area = f"{item['areaDwelling']} m²"
-                            else:
-                                area = 'No area info'
-                            
-                            property_type = ''
-                            if isinstance(item.get('dwellingType'), dict):
-                                property_type = item['dwellingType'].get('localizedName', '')
-                            else:
-                                property_type = item.get('objectType', '')
-                            
-                            house_type = ''
-                            if isinstance(item.get('woningsoort'), dict):
-                                house_type = item['woningsoort'].get('localizedNaam', '')
-                            else:
-                                house_type = item['toewijzingModelCategorie'].get('code', '')
-
-                            # Extract image URL
-                            img_url = ''
-                            if item.get('pictures') and len(item['pictures']) > 0:
-                                if isinstance(item['pictures'][0], dict) and 'url' in item['pictures'][0]:
-                                    img_url = item['pictures'][0]['url']
-                                elif isinstance(item['pictures'][0], dict) and 'uri' in item['pictures'][0]:
-                                    img_url = item['pictures'][0]['uri']
-                            
-                            if img_url and not img_url.startswith(('http://', 'https://')):
-                                img_url = f"https://www.roomspot.nl{img_url}"
-                            
-                            # Create link
-                            components = [str(listing_id)]
-                            
-                            if street:
-                                clean_street = street.lower().strip().replace(" ", "")
-                                components.append(clean_street)
-                            
-                            if house_number:
-                                components.append(str(house_number))
-                            
-                            if house_number_addition:
-                                addition = str(house_number_addition).strip().replace(" ", "")
-                                if addition:
-                                    components.append(addition)
-                            
-                            if city_name:
-                                clean_city = city_name.lower().strip().replace(" ", "")
-                                components.append(clean_city)
-                            
-                            clean_url_path = "-".join(components)
-                            link = f"https://www.roomspot.nl/en/housing-offer/to-rent/translate-to-engels-details/{clean_url_path}"
-                            
-                            if not title or title.isspace():
-                                continue
-                            
-                            listing = {
-                                'id': listing_id,
-                                'title': title,
-                                'price': price,
-                                'area': area,
-                                'property_type': property_type,
-                                'house_type': house_type,
-                                'link': link,
-                                'img_url': img_url,
-                                'publication_date': item.get('publicationDate', ''),
-                                'timestamp': time.time(),
-                                'source': 'roomspot'
-                            }
-                            
-                            listings.append(listing)
-                            
-                        except Exception as e:
-                            print(f"Error processing Roomspot listing: {e}")
-                            continue
-                    
-                    print(f"Found {len(listings)} Roomspot listings")
-        
-    except Exception as e:
-        print(f"Error fetching Roomspot listings: {e}")
+    def on_delivered(delivered):
+        if event.kind == ADDED:
+            # The dwelling has reached the excluded webhooks through another source
+            event.sent = tuple(webhook_digest(url) for url in delivered | set(exclude))
+        apply_event(seen_listings, event)
+        NOTIFICATIONS.labels(source, 'delivered').inc()
+        if event.kind == ADDED and not event.relisted:
+            published = parse_publication_date(listing.publication_date)
+            if published:
+                PUBLICATION_TO_NOTIFICATION_SECONDS.labels(source).observe(time.time() - published.timestamp())
+        logger.info("✅ Sent %s %s notification for: %s", scraper_config['name'], event.kind, listing.title,
+                    extra={'source': source, 'listing_id': listing.id, 'event': event.kind})
     
-    return listings
+    def on_failed():
+        # Make sure the next cycle parses the listing again instead of skipping its unchanged page
+        page_source.forget(scraper_config['api_url'])
+        NOTIFICATIONS.labels(source, 'failed').inc()
+        logger.error("❌ Error sending %s %s notification for: %s", scraper_config['name'], event.kind, listing.title,
+                     extra={'source': source, 'listing_id': listing.id, 'event': event.kind})
+    
+    return router.route(
+        scraper_config,
+        listing,
+        lambda listing, source_config: build_embed(listing, source_config, event),
+        on_delivered=on_delivered,
+        on_failed=on_failed,
+        kind=event.kind,
+        exclude=exclude
+    )
 
-async def send_discord_notification(listing, webhook_url, source_config):
-    """Send a notification to Discord about a new listing."""
-    if not webhook_url:
-        print(f"No webhook URL configured for {source_config['name']}")
-        return
-        
-    try:
-        async with aiohttp.ClientSession() as session:
-            webhook = Webhook.from_url(webhook_url, session=session)
-            
-            embed = discord.Embed(
-                title=f"{source_config['emoji']} New {source_config['name']} Listing!",
-                description=f"**{listing['title']}**",
-                color=source_config['color'],
-                url=listing['link']
-            )
-            
-            # Add fields with details
-            embed.add_field(name="Price", value=listing['price'], inline=True)
-            embed.add_field(name="Area", value=listing['area'], inline=True)
-            embed.add_field(name="Property Type", value=listing['property_type'], inline=True)
-            
-            if listing.get('floor'):
-                embed.add_field(name="Floor", value=listing['floor'], inline=True)
-            
-            if listing.get('house_type'):
-                embed.add_field(name="House Type", value=listing['house_type'], inline=True)
-            
-            # Add image if available
-            if listing['img_url']:
-                embed.set_image(url=listing['img_url'])
-            
-            # Add footer with timestamp and source
-            embed.set_footer(
-                text=f"{source_config['name']} • {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(listing['timestamp']))}"
-            )
-            
-            await webhook.send(embed=embed)
-            print(f"✅ Sent {source_config['name']} notification for: {listing['title']}")
-    except Exception as e:
-        print(f"❌ Error sending {source_config['name']} notification: {e}")
+def load_seen_store(scraper_config):
+    """Load the seen-listing store of a scraper, migrating its legacy JSON file if needed."""
+    store = SeenStore(
+        scraper_config['seen_file'],
+        legacy_file=scraper_config.get('legacy_seen_file'),
+        ttl_days=SEEN_TTL_DAYS
+    )
+    return store.load()
 
-def load_seen_listings(filename):
-    """Load previously seen listings from a JSON file."""
-    try:
-        with open(filename, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-def save_seen_listings(listings, filename):
-    """Save seen listings to a JSON file."""
-    with open(filename, 'w') as f:
-        json.dump(listings, f)
-
-async def process_scraper(scraper_name, scraper_config):
-    """Process a single scraper."""
-    if not scraper_config['webhook_url']:
-        print(f"⚠️  Skipping {scraper_name} - no webhook URL configured")
-        return
+
+async def process_scraper(session, router, scraper_name, scraper_config, seen_listings, schedule=None,
+                          tracker=None, history=None, page_source=LOCAL_PAGES, dwellings=None):
+    """Process a single scraper against its seen-listing store: notify its listing events and record them.
+
+    Optional parts: `tracker` (ChangeTracker) derives changed and removed
+    listings, `history` records the cycle, `schedule` observes every parsed
+    listing, `page_source` walks the pages and `dwellings` (DwellingIndex)
+    matches added listings across sources. Returns a dict with the number of
+    parsed and new listings; a failed walk raises FetchError.
+    """
+    if not has_targets(scraper_config):
+        logger.warning("⚠️  Skipping %s - no webhook URL configured", scraper_name)
+        return {'listings': 0, 'new': 0}
     
-    print(f"\n🔍 Processing {scraper_config['name']} scraper...")
+    logger.info("🔍 Processing %s scraper...", scraper_config['name'])
     
-    # Load seen listings for this scraper
-    seen_listings = load_seen_listings(scraper_config['seen_file'])
+    # Results sorted newest-first let us stop at the first page with nothing new
+    early_stop = scraper_config['sort'] == SORT_BY_PUBLICATION_DATE
+    notify_events = scraper_config['notify_events']
     
-    # Get listings based on scraper type
-    if scraper_name == 'plaza':
-        current_listings = await get_plaza_listings()
-    elif scraper_name == 'roomspot':
-        current_listings = await get_roomspot_listings()
-    else:
-        print(f"Unknown scraper: {scraper_name}")
-        return
+    diff_seconds = DIFF_SECONDS.labels(scraper_name)
+    counters = {
+        status: LISTINGS.labels(scraper_name, status)
+        for status in ('new', 'known', 'pending', 'filtered', 'duplicate', 'changed', 'relisted', 'removed')
+    }
+    total_listings = 0
+    total_new = 0
+    total_filtered = 0
+    changed_pages = 0
+    unchanged_pages = 0
+    cycle_listings = []
+    removed_ids = []
     
-    if not current_listings:
-        print(f"No {scraper_config['name']} listings found")
-        return
+    def handle_events(events):
+        nonlocal total_filtered
+        for event in events:
+            listing = event.listing
+            status = 'relisted' if event.relisted else ('new' if event.kind == ADDED else event.kind)
+            counters[status].inc()
+            announced = ()
+            # Link to the dwelling on other sources and skip the webhooks they already announced it to
+            if dwellings is not None and event.kind == ADDED:
+                address = dwellings.add(scraper_name, listing)
+                others = dwellings.others(scraper_name, address) if address else ()
+                if others:
+                    event.also_on = tuple((config['name'], link) for config, link, _ in others)
+                    sent = set().union(*(other_sent for _, _, other_sent in others))
+                    announced = {url for url in router.targets(scraper_config, listing)
+                                 if webhook_digest(url) in sent}
+            # Events that are not notified, or reach no webhook, are recorded right away
+            if event.kind not in notify_events:
+                apply_event(seen_listings, event)
+                continue
+            logger.info("%s %s listing %s: %s (ID: %s)", EVENT_ICONS[status], scraper_config['name'], status,
+                        listing.title, listing.id, extra={'source': scraper_name, 'listing_id': listing.id,
+                                                          'event': event.kind})
+            if not route_event(router, event, scraper_config, seen_listings, page_source, announced):
+                if announced and router.targets(scraper_config, listing):
+                    logger.info("👯 %s listing already announced from %s: %s", scraper_config['name'],
+                                ', '.join(name for name, _ in event.also_on), listing.title,
+                                extra={'source': scraper_name, 'listing_id': listing.id, 'event': event.kind})
+                    event.sent = tuple(webhook_digest(url) for url in announced)
+                    apply_event(seen_listings, event)
+                    counters['duplicate'].inc()
+                    continue
+                logger.debug("🚫 %s listing matches no subscription: %s", scraper_config['name'], listing.title)
+                apply_event(seen_listings, event)
+                counters['filtered'].inc()
+                total_filtered += 1
     
-    # Check for new listings
-    new_listings = []
-    for listing in current_listings:
-        if listing['id'] not in seen_listings:
-            print(f"🆕 New {scraper_config['name']} listing: {listing['title']} (ID: {listing['id']})")
-            new_listings.append(listing)
-            seen_listings.append(listing['id'])
+    if tracker:
+        tracker.start_cycle()
+    pages = page_source.walk(session, scraper_name, scraper_config)
+    try:
+        async for page, page_listings in pages:
+            if page_listings is None:
+                # Nothing on this page can be new; with a newest-first sort nothing after it either
+                unchanged_pages += 1
+                if tracker:
+                    tracker.record_page(page, None)
+                if early_stop:
+                    break
+                continue
+            
+            changed_pages += 1
+            total_listings += len(page_listings)
+            cycle_listings.extend(page_listings)
+        
+            # Diff the page against the seen store in one pass
+            start = time.perf_counter()
+            events = []
+            new = known = pending = 0
+            for listing in page_listings:
+                if schedule:
+                    schedule.observe(listing)
+                if listing.id in seen_listings:
+                    seen_listings.touch(listing.id)
+                    event = tracker.diff(listing) if tracker else None
+                    if event is None:
+                        known += 1
+                        continue
+                else:
+                    event = ListingEvent(ADDED, listing)
+                if router.is_pending(scraper_name, listing.id, event.kind):
+                    pending += 1
+                    continue
+                if event.kind == ADDED and not event.relisted:
+                    new += 1
+                events.append(event)
+            if tracker:
+                tracker.record_page(page, page_listings)
+            diff_seconds.observe(time.perf_counter() - start)
+            counters['known'].inc(known)
+            counters['pending'].inc(pending)
+            total_new += new
+        
+            # Queue notifications for this page before the next one is consumed
+            handle_events(events)
+        
+            if not new and early_stop and page_listings:
+                logger.debug("⏹️  %s: page contained only known listings, stopping early", scraper_config['name'])
+                if tracker:
+                    tracker.mark_incomplete()
+                break
         else:
-            print(f"👀 Known {scraper_config['name']} listing: {listing['title']}")
+            if tracker:
+                removed = tracker.removed(scraper_config['max_pages'])
+                removed_ids.extend(event.listing.id for event in removed)
+                handle_events(
+                    event for event in removed
+                    if not router.is_pending(scraper_name, event.listing.id, event.kind)
+                )
+    except BaseException:
+        # The page being handled when the cycle failed (or was cancelled) must be parsed again next time
+        page_source.forget(scraper_config['api_url'])
+        raise
+    finally:
+        await pages.aclose()
     
-    print(f"📊 {scraper_config['name']}: {len(new_listings)} new listings out of {len(current_listings)} total")
+    if tracker:
+        # Listings on unchanged or unwalked pages weren't diffed; keep them from ageing out of the seen store
+        now = time.time()
+        for listing_id in tracker.listed():
+            if listing_id in seen_listings:
+                seen_listings.touch(listing_id, now)
     
-    # Send notifications for new listings
-    for listing in new_listings:
-        await send_discord_notification(listing, scraper_config['webhook_url'], scraper_config)
+    if history:
+        history.record_cycle(scraper_name, cycle_listings, tracker.present if tracker else (), removed_ids)
+    
+    CYCLE_STATS['cycles'] += 1
+    if unchanged_pages and not changed_pages:
+        CYCLE_STATS['cycles_short_circuited'] += 1
+        logger.info("⏭️  %s: API response unchanged since last cycle, nothing to do", scraper_config['name'])
+        return {'listings': 0, 'new': 0}
+    
+    if not total_listings:
+        if len(seen_listings):
+            logger.warning("📭 %s: the API returned no listings; known listings are not treated as withdrawn",
+                           scraper_config['name'])
+        else:
+            logger.info("No %s listings found", scraper_config['name'])
+        return {'listings': 0, 'new': 0}
     
-    # Save updated seen listings
-    save_seen_listings(seen_listings, scraper_config['seen_file'])
+    logger.info(
+        "📊 %s: %d new listings out of %d total%s", scraper_config['name'], total_new, total_listings,
+        f", {total_filtered} filtered out" if total_filtered else '',
+        extra={'source': scraper_name, 'listings': total_listings, 'new': total_new, 'filtered': total_filtered}
+    )
+    return {'listings': total_listings, 'new': total_new}
+
+async def run_scraper_cycle(session, router, limiter, scraper_name, scraper_config, tracker, schedule,
+                            history=None, page_source=LOCAL_PAGES, dwellings=None):
+    """Run one scrape cycle of a single scraper and report its statistics.
+
+    `limiter` bounds how many sources are scraped at the same time; `tracker`
+    is the source's ChangeTracker, holding its seen store. Listings are
+    recorded in `history` if given, pages come from `page_source`, and new
+    listings are clustered across sources in `dwellings` if given.
+    """
+    seen_store = tracker.store
+    async with limiter:
+        logger.info("🔄 Starting %s scrape cycle", scraper_config['name'])
+        
+        with CYCLE_SECONDS.labels(scraper_name).time():
+            await process_scraper(session, router, scraper_name, scraper_config, seen_store, schedule, tracker, history,
+                                  page_source, dwellings)
+        if seen_store.maintain() and dwellings is not None:
+            dwellings.prune(scraper_name)
+    
+    logger.debug("🔌 HTTP connections: %s", connection_stats_summary())
+    logger.debug(
+        "♻️  Short-circuited %d/%d cycles (%d pages not modified, %d unchanged of %d fetched)",
+        CYCLE_STATS['cycles_short_circuited'], CYCLE_STATS['cycles'],
+        FETCH_STATS['pages_not_modified'], FETCH_STATS['pages_unchanged'], FETCH_STATS['pages_fetched']
+    )
+    logger.debug(
+        "📨 Notifications: %d delivered in %d messages, %d failed, %d rate limited",
+        DISPATCH_STATS['delivered'], DISPATCH_STATS['messages'], DISPATCH_STATS['failed'],
+        DISPATCH_STATS['rate_limited']
+    )
+
+
+class _RunningSource:
+    __slots__ = ('config', 'tracker', 'schedule', 'task')
+
+    def __init__(self, config, tracker, schedule):
+        self.config = config
+        self.tracker = tracker
+        self.schedule = schedule
+        self.task = None
+
+
+class RunningSources:
+    """The sources being polled, each with its config, change tracker, schedule and task.
+
+    `apply` swaps in a freshly loaded config: sources that were removed or
+    lost their webhooks are stopped, new ones started, and running ones pick
+    up the new config on their next cycle without losing their state.
+    """
+
+    def __init__(self, session, router, limiter, history=None, page_source=LOCAL_PAGES, dwellings=None):
+        self.session = session
+        self.router = router
+        self.limiter = limiter
+        self.history = history
+        self.page_source = page_source
+        self.dwellings = dwellings
+        self.running = {}
+
+    def _start(self, key, config):
+        store = load_seen_store(config)
+        logger.info("📂 %s: %d seen listings loaded", config['name'], len(store))
+        source = _RunningSource(config, ChangeTracker(store), SourceSchedule(config['interval'], config['busy_interval']))
+        if self.dwellings is not None:
+            self.dwellings.attach(key, config, store)
+
+        async def poll():
+            await run_scraper_cycle(self.session, self.router, self.limiter, key, source.config, source.tracker,
+                                    source.schedule, self.history, self.page_source, self.dwellings)
+
+        source.task = asyncio.create_task(run_source(config['name'], source.schedule, poll))
+        self.running[key] = source
+        logger.info("📅 %s: every %d seconds, %d seconds in busy windows",
+                    config['name'], config['interval'], config['busy_interval'])
+
+    async def _stop(self, key, source):
+        if self.dwellings is not None:
+            self.dwellings.detach(key)
+        source.task.cancel()
+        try:
+            await source.task
+        except asyncio.CancelledError:
+            pass
+        source.tracker.store.close()
+
+    async def apply(self, sources):
+        """Start, stop and update sources to match `sources` (as returned by load_config)."""
+        enabled = {}
+        for key, config in sources.items():
+            if has_targets(config):
+                enabled[key] = config
+            else:
+                logger.warning("⚠️  %s scraper disabled (no webhook URL)", config['name'])
+
+        # Everything below up to the first await happens at once, so no cycle sees half a config
+        stopping = []
+        for key in list(self.running):
+            config = enabled.get(key)
+            current = self.running[key].config
+            if config is None or (config['seen_file'], config.get('legacy_seen_file')) != (
+                    current['seen_file'], current.get('legacy_seen_file')):
+                stopping.append((key, self.running.pop(key)))
+                logger.info("🛑 %s scraper stopped", current['name'])
+        for key, config in enabled.items():
+            source = self.running.get(key)
+            if source is None:
+                continue
+            current = source.config
+            if (config['api_url'], config['payload']) != (current['api_url'], current['payload']):
+                # A different query: its pages can't be compared with the previous ones
+                self.page_source.forget(current['api_url'])
+                source.tracker.reset()
+            source.schedule.update(config['interval'], config['busy_interval'])
+            source.config = config
+            if self.dwellings is not None:
+                self.dwellings.update(key, config)
+
+        for key, source in stopping:
+            await self._stop(key, source)
+        for key, config in enabled.items():
+            if key not in self.running:
+                self._start(key, config)
+                logger.info("✅ %s scraper enabled", config['name'])
+        if not self.running:
+            logger.error("❌ No scrapers enabled! Please configure webhook URLs in your .env file")
+
+    async def close(self):
+        for key, source in self.running.items():
+            await self._stop(key, source)
+        self.running.clear()
+
+
+async def watch_config(sources, watcher, interval):
+    """Reload sources.json and .env whenever they change, keeping the current config if the new one is invalid."""
+    while True:
+        await asyncio.sleep(interval)
+        if not watcher.changed():
+            continue
+        try:
+            load_dotenv(override=True)
+            config, subscriptions = load_config(SOURCES_FILE)
+        except (OSError, ValueError) as e:
+            logger.error("❌ Config change rejected, keeping the current config: %s", e)
+            continue
+        except Exception:
+            # A gap in the validation must not stop the scraper (and crash-loop it under pm2)
+            logger.exception("❌ Config change rejected, keeping the current config")
+            continue
+        logger.info("🔁 Reloaded %d sources and %d subscriptions from %s", len(config), len(subscriptions), SOURCES_FILE)
+        sources.router.dispatcher.revive()
+        await sources.apply(config)
 
 async def main():
     """Main function to run all scrapers."""
-    print("🚀 Starting Combined Apartment Scraper...")
-    print(f"📅 Check interval: {CHECK_INTERVAL} seconds")
+    setup_logging(LOG_LEVEL, LOG_FORMAT)
+    logger.info("🚀 Starting Combined Apartment Scraper...")
     
-    # Check which scrapers are enabled
-    enabled_scrapers = []
-    for name, config in SCRAPERS.items():
-        if config['webhook_url']:
-            enabled_scrapers.append(name)
-            print(f"✅ {config['name']} scraper enabled")
-        else:
-            print(f"⚠️  {config['name']} scraper disabled (no webhook URL)")
+    if RECORD_DIR:
+        enable_recording(RECORD_DIR)
+        logger.info("📼 Recording API responses to %s", RECORD_DIR)
     
-    if not enabled_scrapers:
-        print("❌ No scrapers enabled! Please configure webhook URLs in your .env file")
-        return
+    watcher = ConfigWatcher([SOURCES_FILE, '.env'])
+    scrapers, subscriptions = load_config(SOURCES_FILE)
+    logger.info("📋 Loaded %d sources and %d subscriptions from %s", len(scrapers), len(subscriptions), SOURCES_FILE)
     
-    while True:
+    history = None
+    if HISTORY_DB:
+        from history import ListingHistory
+        history = ListingHistory(HISTORY_DB)
+        logger.info("🗄️  Recording listing history in %s", HISTORY_DB)
+    
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(int(METRICS_PORT), host=METRICS_HOST)
+        logger.info("📈 Serving metrics on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+    
+    # One pooled session for every fetch and notification, reused across cycles
+    async with create_session() as session:
+        thumbnailer = None
+        if THUMBNAIL_DIR:
+            import thumbnails
+            if thumbnails.available():
+                cache = thumbnails.ThumbnailCache(THUMBNAIL_DIR, THUMBNAIL_CACHE_MB * 1024 * 1024)
+                thumbnailer = thumbnails.Thumbnailer(session, cache, concurrency=THUMBNAIL_CONCURRENCY)
+                logger.info("🖼️  Attaching thumbnails, cached in %s", THUMBNAIL_DIR)
+            else:
+                logger.warning("⚠️  THUMBNAIL_DIR is set but Pillow is not installed; sending image URLs instead")
+        dispatcher = NotificationDispatcher(session, thumbnailer=thumbnailer, thumbnail_wait=THUMBNAIL_WAIT)
+        router = Router(dispatcher)
+        limiter = asyncio.Semaphore(MAX_CONCURRENT_SOURCES)
+        
+        page_source = LOCAL_PAGES
+        if WORKERS > 0:
+            from shards import ShardPool
+            page_source = ShardPool(WORKERS, LOG_LEVEL, LOG_FORMAT, RECORD_DIR)
+            page_source.start()
+            logger.info("👷 Fetching and parsing in %d worker processes", WORKERS)
+        
+        # pm2 stops the scraper with SIGINT (SIGTERM from other supervisors); finish up instead of dying mid-cycle
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+        
+        # Every scraper polls on its own schedule, in its own task; seen IDs are kept in memory while it runs
+        dwellings = DwellingIndex(router.sending) if DEDUPE_DWELLINGS else None
+        sources = RunningSources(session, router, limiter, history, page_source, dwellings)
+        tasks = []
         try:
-            print(f"\n{'='*50}")
-            print(f"🔄 Starting scrape cycle at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"{'='*50}")
-            
-            # Process all enabled scrapers
-            tasks = []
-            for scraper_name in enabled_scrapers:
-                tasks.append(process_scraper(scraper_name, SCRAPERS[scraper_name]))
-            
-            # Run all scrapers concurrently
-            await asyncio.gather(*tasks)
+            await sources.apply(scrapers)
             
-            print(f"\n✅ Scrape cycle completed. Next check in {CHECK_INTERVAL} seconds...")
-            await asyncio.sleep(CHECK_INTERVAL)
+            tasks.append(asyncio.ensure_future(watch_config(sources, watcher, CONFIG_POLL_INTERVAL)))
+            logger.info("👀 Watching %s and .env for changes every %g seconds", SOURCES_FILE, CONFIG_POLL_INTERVAL)
+            if METRICS_FILE:
+                tasks.append(asyncio.ensure_future(dump_periodically(METRICS_FILE, METRICS_DUMP_INTERVAL)))
+                logger.info("📈 Writing metrics to %s every %d seconds", METRICS_FILE, METRICS_DUMP_INTERVAL)
             
-        except Exception as e:
-            print(f"❌ Error in main loop: {e}")
-            print("Traceback:", traceback.format_exc())
-            await asyncio.sleep(60)  # Wait a minute before retrying
+            stopped = asyncio.ensure_future(stopping.wait())
+            await asyncio.wait([stopped, *tasks], return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task.done():
+                    task.result()
+            logger.info("🛑 Shutting down...")
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+            for task in tasks:
+                task.cancel()
+            await sources.close()
+            # Deliver what the last cycles found; anything still queued after the grace period is lost
+            try:
+                await asyncio.wait_for(dispatcher.join(), SHUTDOWN_GRACE)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️  Notifications still queued after %g seconds, exiting anyway", SHUTDOWN_GRACE)
+            await dispatcher.close()
+            if thumbnailer:
+                await thumbnailer.close()
+            if page_source is not LOCAL_PAGES:
+                await page_source.close()
+            if history:
+                history.close()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+        logger.info("👋 Stopped")
 
 if __name__ == "__main__":
     asyncio.run(main()) 
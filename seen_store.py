@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seen IDs not encountered for this many days are forgotten on compaction
+SEEN_TTL_DAYS = 90
+
+# Compact once the log holds this many times more lines than live IDs
+COMPACT_RATIO = 2
+COMPACT_MIN_LINES = 1000
+
+# Compact at least this often so refreshed last-seen times reach disk
+COMPACT_INTERVAL = 86400
+
+
+class SeenStore:
+    """Set of seen listing IDs, held in memory and persisted in an append-only log.
+
+    Each line of the log is a JSON record {"id": ..., "ts": ...}, optionally
+    with the listing's snapshot: "fp" (content fingerprint) and "price", its
+    dwelling's "addr" (listing.address_key) and "link", "sent" (digests of the
+    webhooks the dwelling was announced to, dwellings.webhook_digest) and
+    "gone": true once the listing disappeared from the results. The last
+    record of an ID wins. New IDs and snapshot changes are appended as they
+    happen; compaction rewrites the log atomically with only the live IDs,
+    dropping those older than the TTL. On first use the IDs of an existing
+    seen_listings_*.json file are migrated into the log.
+    """
+
+    def __init__(self, path, legacy_file=None, ttl_days=SEEN_TTL_DAYS):
+        self.path = path
+        self.legacy_file = legacy_file
+        self.ttl = ttl_days * 86400
+        self._last_seen = {}
+        self._snapshots = {}
+        self._addresses = {}
+        self._sent = {}
+        self._gone = set()
+        self._log_lines = 0
+        self._log = None
+        self._compacted_at = time.time()
+
+    def load(self):
+        """Load the log (or migrate the legacy JSON file) into memory."""
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        record = json.loads(line)
+                        listing_id = str(record['id'])
+                        self._last_seen[listing_id] = float(record['ts'])
+                    except (ValueError, KeyError, TypeError):
+                        # A torn last line after a crash; the next compaction drops it
+                        continue
+                    if 'fp' in record:
+                        self._snapshots[listing_id] = (record['fp'], record.get('price'))
+                    else:
+                        self._snapshots.pop(listing_id, None)
+                    if 'addr' in record:
+                        self._addresses[listing_id] = (record['addr'], record.get('link', ''))
+                    else:
+                        self._addresses.pop(listing_id, None)
+                    if 'sent' in record:
+                        self._sent[listing_id] = set(record['sent'])
+                    else:
+                        self._sent.pop(listing_id, None)
+                    if record.get('gone'):
+                        self._gone.add(listing_id)
+                    else:
+                        self._gone.discard(listing_id)
+        elif self.legacy_file and os.path.exists(self.legacy_file):
+            with open(self.legacy_file, 'r') as f:
+                ids = json.load(f)
+            now = time.time()
+            for listing_id in ids:
+                self._last_seen[str(listing_id)] = now
+            logger.info("📦 Migrated %d seen IDs from %s to %s", len(ids), self.legacy_file, self.path)
+            self.compact()
+
+        self.evict_expired()
+        return self
+
+    def __contains__(self, listing_id):
+        return listing_id in self._last_seen
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def _record(self, listing_id):
+        record = {'id': listing_id, 'ts': self._last_seen[listing_id]}
+        snapshot = self._snapshots.get(listing_id)
+        if snapshot:
+            record['fp'], price = snapshot
+            if price is not None:
+                record['price'] = price
+        address = self._addresses.get(listing_id)
+        if address:
+            record['addr'], record['link'] = address
+        sent = self._sent.get(listing_id)
+        if sent:
+            record['sent'] = sorted(sent)
+        if listing_id in self._gone:
+            record['gone'] = True
+        return json.dumps(record)
+
+    def _append(self, listing_id):
+        if self._log is None:
+            self._log = open(self.path, 'a')
+        self._log.write(self._record(listing_id) + '\n')
+        self._log.flush()
+        self._log_lines += 1
+
+    def add(self, listing_id, timestamp=None, fingerprint=None, price=None, address=None, link='', sent=()):
+        """Mark an ID as seen (and no longer gone), with an optional snapshot and address, and append it to the log.
+
+        `sent` webhook digests are added to those the ID's dwelling was already announced to.
+        """
+        self._last_seen[listing_id] = timestamp or time.time()
+        if fingerprint is not None:
+            self._snapshots[listing_id] = (fingerprint, price)
+        if address is not None:
+            self._addresses[listing_id] = (address, link)
+        if sent:
+            self._sent.setdefault(listing_id, set()).update(sent)
+        self._gone.discard(listing_id)
+        self._append(listing_id)
+
+    def touch(self, listing_id, timestamp=None):
+        """Refresh the last-seen time of a known ID. Persisted on the next compaction."""
+        self._last_seen[listing_id] = timestamp or time.time()
+
+    def snapshot(self, listing_id):
+        """The (fingerprint, price) stored for an ID, or None."""
+        return self._snapshots.get(listing_id)
+
+    def set_snapshot(self, listing_id, fingerprint, price=None):
+        """Store a new snapshot for a known ID and append it to the log."""
+        self._snapshots[listing_id] = (fingerprint, price)
+        self._append(listing_id)
+
+    def is_gone(self, listing_id):
+        return listing_id in self._gone
+
+    def mark_gone(self, listing_id):
+        """Record that a known ID disappeared from the results."""
+        self._gone.add(listing_id)
+        self._append(listing_id)
+
+    def live_ids(self):
+        """IDs with a snapshot that are not marked gone."""
+        return [listing_id for listing_id in self._snapshots if listing_id not in self._gone]
+
+    def addresses(self):
+        """(ID, address key, link) of the IDs with an address that are not marked gone."""
+        return [(listing_id, address, link) for listing_id, (address, link) in self._addresses.items()
+                if listing_id not in self._gone]
+
+    def sent(self, listing_id):
+        """Digests of the webhooks an ID's dwelling was announced to."""
+        return self._sent.get(listing_id, set())
+
+    def evict_expired(self, now=None):
+        """Forget IDs not seen within the TTL. Returns the number of IDs evicted."""
+        cutoff = (now or time.time()) - self.ttl
+        expired = [listing_id for listing_id, ts in self._last_seen.items() if ts < cutoff]
+        for listing_id in expired:
+            del self._last_seen[listing_id]
+            self._snapshots.pop(listing_id, None)
+            self._addresses.pop(listing_id, None)
+            self._sent.pop(listing_id, None)
+            self._gone.discard(listing_id)
+        return len(expired)
+
+    def compact(self):
+        """Atomically rewrite the log with one line per live ID."""
+        self.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for listing_id in self._last_seen:
+                f.write(self._record(listing_id) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._last_seen)
+        self._compacted_at = time.time()
+
+    def maintain(self):
+        """Evict expired IDs and compact the log once it has grown enough. Returns the number of IDs evicted."""
+        evicted = self.evict_expired()
+        if (evicted
+                or self._log_lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self._last_seen))
+                or time.time() - self._compacted_at > COMPACT_INTERVAL):
+            self.compact()
+        return evicted
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
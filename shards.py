@@ -0,0 +1,253 @@
+"""Fetch and parse sources in worker processes.
+
+With many sources, decoding and parsing API pages keeps a single event loop
+busy. A ShardPool spreads the sources over worker processes, each with its
+own event loop and HTTP session, that walk their sources' pages and parse
+them. Everything stateful stays in the main process (the coordinator): the
+seen stores, change tracking, history and the notification dispatcher.
+
+Coordinator and workers talk over multiprocessing queues. A walk is
+pull-based, like a local walk: the worker sends a page, and only fetches on
+(and remembers the page as processed) once the coordinator asks for the next
+one, so a walk the coordinator stops early is picked up where it stopped.
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import zlib
+
+from fetcher import FetchError, enable_recording, forget_pages
+from http_session import create_session
+from logs import setup_logging
+from pages import iter_listing_pages
+from sources import compile_parser
+
+logger = logging.getLogger(__name__)
+
+# Source settings a worker needs to walk and parse a source
+WALK_KEYS = ('key', 'name', 'emoji', 'api_url', 'payload', 'headers', 'page_size', 'sort', 'max_pages',
+             'fields', 'link', 'base_url')
+
+# How often (seconds) workers and the coordinator check that the other side is still alive
+LIVENESS_INTERVAL = 1.0
+
+# Seconds a worker gets to stop before it is terminated
+STOP_TIMEOUT = 5.0
+
+
+def _read_requests(requests, loop, handle):
+    """Worker thread: hand coordinator messages to the event loop; stop if the coordinator is gone."""
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            message = requests.get(timeout=LIVENESS_INTERVAL)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                message = ('stop',)
+            else:
+                continue
+        loop.call_soon_threadsafe(handle, message)
+        if message[0] == 'stop':
+            return
+
+
+async def _walk(session, walk_id, config, commands, results):
+    error = None
+    try:
+        pages = iter_listing_pages(session, config['key'], config)
+        try:
+            async for page, listings in pages:
+                results.put(('page', walk_id, page, listings))
+                if await commands.get() == 'cancel':
+                    break
+        finally:
+            await pages.aclose()
+    except FetchError as e:
+        error = e
+    except Exception as e:
+        logger.exception("❌ Error walking %s: %s", config['name'], e)
+        # Only send what is sure to unpickle in the coordinator
+        error = RuntimeError(f"{type(e).__name__}: {e}")
+    results.put(('done', walk_id, error))
+
+
+async def _serve(requests, results):
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    walks = {}
+    configs = {}
+
+    async with create_session() as session:
+        def handle(message):
+            command = message[0]
+            if command == 'walk':
+                _, walk_id, spec = message
+                cached = configs.get(spec['key'])
+                if cached is None or cached[0] != spec:
+                    config = dict(spec, parser=compile_parser(spec))
+                    configs[spec['key']] = cached = (spec, config)
+                commands = asyncio.Queue()
+                task = asyncio.ensure_future(_walk(session, walk_id, cached[1], commands, results))
+                walks[walk_id] = commands
+                task.add_done_callback(lambda _: walks.pop(walk_id, None))
+            elif command in ('next', 'cancel'):
+                commands = walks.get(message[1])
+                if commands is not None:
+                    commands.put_nowait(command)
+            elif command == 'forget':
+                forget_pages(message[1])
+            elif command == 'stop':
+                stopped.set()
+
+        reader = threading.Thread(target=_read_requests, args=(requests, loop, handle), daemon=True)
+        reader.start()
+        await stopped.wait()
+        for commands in walks.values():
+            commands.put_nowait('cancel')
+
+
+def _worker_main(index, requests, results, log_level, log_format, record_dir):
+    """Entry point of a worker process."""
+    # Ctrl-C and pm2's SIGINT/SIGTERM reach the whole process group; the coordinator decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_logging(log_level, log_format)
+    if record_dir:
+        enable_recording(record_dir)
+    logger.debug("👷 Worker %d started", index)
+    asyncio.run(_serve(requests, results))
+    results.cancel_join_thread()
+
+
+class ShardPool:
+    """Walks sources in `workers` worker processes, for the coordinator in the main process.
+
+    Drop-in for pages.LOCAL_PAGES: `walk` yields the same (page, listings)
+    as a local walk, and `forget` reaches every worker. Each source always
+    goes to the same worker, so its page cache and circuit breaker live in
+    one place. A worker that dies is restarted; its running walks fail with
+    FetchError.
+    """
+
+    def __init__(self, workers, log_level='INFO', log_format='text', record_dir=None):
+        self.workers = workers
+        self.log_level = log_level
+        self.log_format = log_format
+        self.record_dir = record_dir
+        # spawn: forking a process that runs an event loop and threads is not safe
+        self._context = multiprocessing.get_context('spawn')
+        self._results = None
+        self._requests = []
+        self._processes = []
+        self._walks = {}
+        self._ids = itertools.count()
+        self._loop = None
+        self._reader = None
+        self._monitor = None
+
+    def start(self):
+        """Start the workers; call it from the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._results = self._context.Queue()
+        for index in range(self.workers):
+            self._requests.append(None)
+            self._processes.append(None)
+            self._spawn(index)
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+        self._monitor = asyncio.ensure_future(self._watch_workers())
+
+    def _spawn(self, index):
+        requests = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, requests, self._results, self.log_level, self.log_format, self.record_dir),
+            name=f"scraper-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._requests[index] = requests
+        self._processes[index] = process
+
+    def _read_results(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                return
+            self._loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message):
+        walk = self._walks.get(message[1])
+        if walk is not None:
+            walk[1].put_nowait(message)
+
+    async def _watch_workers(self):
+        while True:
+            await asyncio.sleep(LIVENESS_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                logger.error("❌ Worker %d exited with code %s, restarting it", index, process.exitcode)
+                for walk_id, (shard, messages) in list(self._walks.items()):
+                    if shard == index:
+                        messages.put_nowait(('done', walk_id, FetchError(f"worker {index} exited during the walk")))
+                self._spawn(index)
+
+    def shard(self, source_key):
+        """The worker a source is walked by."""
+        return zlib.crc32(source_key.encode()) % self.workers
+
+    def walk(self, session, scraper_name, scraper_config):
+        """Async iterator over (page, listings) of a source, walked by its worker."""
+        return self._walk(scraper_name, {key: scraper_config[key] for key in WALK_KEYS})
+
+    async def _walk(self, scraper_name, spec):
+        shard = self.shard(scraper_name)
+        walk_id = next(self._ids)
+        messages = asyncio.Queue()
+        self._walks[walk_id] = (shard, messages)
+        self._requests[shard].put(('walk', walk_id, spec))
+        done = False
+        try:
+            while True:
+                message = await messages.get()
+                if message[0] == 'done':
+                    done = True
+                    if message[2] is not None:
+                        raise message[2]
+                    return
+                _, _, page, listings = message
+                yield page, listings
+                self._requests[shard].put(('next', walk_id))
+        finally:
+            del self._walks[walk_id]
+            if not done:
+                self._requests[shard].put(('cancel', walk_id))
+
+    def forget(self, api_url):
+        """Make the next walk of an endpoint parse every page again."""
+        for requests in self._requests:
+            requests.put(('forget', api_url))
+
+    async def close(self):
+        """Stop the workers, terminating those that don't stop within STOP_TIMEOUT."""
+        if self._monitor:
+            self._monitor.cancel()
+        for requests in self._requests:
+            requests.put(('stop',))
+
+        def join():
+            for process in self._processes:
+                process.join(STOP_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        await asyncio.to_thread(join)
+        if self._results is not None:
+            self._results.put(None)
+            await asyncio.to_thread(self._reader.join)
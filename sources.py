@@ -0,0 +1,321 @@
+import json
+import os
+import re
+import string
+import time
+
+from fetcher import PAGE_SIZE, MAX_PAGES, SORT_BY_PRICE
+from listing import Listing
+from changes import ADDED, EVENT_TYPES
+from filters import load_subscriptions, apply_subscriptions
+
+SOURCES_FILE = 'sources.json'
+
+# Fallbacks for settings a source (or the file's "defaults") doesn't set
+DEFAULTS = {
+    'sort': SORT_BY_PRICE,
+    'page_size': PAGE_SIZE,
+    'max_pages': MAX_PAGES,
+    'interval': 1500,  # 25 minutes
+    'busy_interval': 300,  # 5 minutes, during hours listings are usually published
+    'headers': {},
+    'emoji': '🏠',
+    'color': '#3498db',
+    # Listing events to notify: added, changed and/or removed
+    'notify_events': [ADDED]
+}
+
+REQUIRED_KEYS = ('name', 'api_url', 'base_url', 'payload', 'fields', 'link')
+
+# Settings that must be positive numbers, and settings that must be JSON objects
+POSITIVE_KEYS = ('page_size', 'max_pages', 'interval', 'busy_interval')
+OBJECT_KEYS = ('payload', 'fields', 'link', 'headers')
+
+# Settings that must be strings when set
+STRING_KEYS = ('name', 'api_url', 'base_url', 'emoji', 'sort', 'webhook_env')
+
+# Fields every source must be able to map
+REQUIRED_FIELDS = ('street', 'city', 'postal_code')
+
+
+# Ways of building the {path} part of a listing link:
+#   title_slug     <id>-<slugified title>
+#   address_parts  <id>-<street>-<number>-<addition>-<city>
+LINK_PATHS = ('title_slug', 'address_parts')
+
+
+def _parse_color(value):
+    if isinstance(value, int):
+        return value
+    return int(str(value).lstrip('#'), 16)
+
+
+def read_config(path):
+    """The JSON object in a config file. Raises ValueError if it is not valid JSON or not an object."""
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path} must hold a JSON object")
+    return raw
+
+
+def _check_template(key, template):
+    """Raise ValueError unless a link template is a string whose only placeholder is {path}."""
+    if not isinstance(template, str):
+        raise ValueError(f"Source '{key}': link template must be a string")
+    try:
+        placeholders = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+    except ValueError as e:
+        raise ValueError(f"Source '{key}' has an invalid link template: {e}") from None
+    if placeholders != {'path'}:
+        raise ValueError(f"Source '{key}': link template must contain {{path}} and no other placeholders")
+
+
+def load_sources(path=SOURCES_FILE):
+    """Load and validate the source definitions from a JSON file.
+
+    Returns a dict of source name -> config. Each source's webhook URL is read
+    from the environment variable named by its "webhook_env" (or taken from a
+    literal "webhook_url"). Raises ValueError for an invalid definition.
+    """
+    raw = read_config(path)
+    for name in ('defaults', 'sources'):
+        if not isinstance(raw.get(name, {}), dict):
+            raise ValueError(f"\"{name}\" must be an object")
+
+    defaults = dict(DEFAULTS, **raw.get('defaults', {}))
+    sources = {}
+    for key, definition in raw.get('sources', {}).items():
+        if not isinstance(definition, dict):
+            raise ValueError(f"Source '{key}' must be an object")
+        config = dict(defaults, **definition)
+
+        missing = [k for k in REQUIRED_KEYS if k not in config]
+        if missing:
+            raise ValueError(f"Source '{key}' is missing {', '.join(missing)}")
+        for name in STRING_KEYS:
+            if name in config and not isinstance(config[name], str):
+                raise ValueError(f"Source '{key}': {name} must be a string")
+        if config.get('webhook_url') is not None and not isinstance(config['webhook_url'], str):
+            raise ValueError(f"Source '{key}': webhook_url must be a string")
+        for name in POSITIVE_KEYS:
+            value = config[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"Source '{key}': {name} must be a positive number")
+        for name in OBJECT_KEYS:
+            if not isinstance(config[name], dict):
+                raise ValueError(f"Source '{key}': {name} must be an object")
+        for name, paths in config['fields'].items():
+            if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+                raise ValueError(f"Source '{key}': field {name} must be a list of API paths")
+        missing = [f for f in REQUIRED_FIELDS if f not in config['fields']]
+        if missing:
+            raise ValueError(f"Source '{key}' has no field mapping for {', '.join(missing)}")
+        if config['link'].get('path') not in LINK_PATHS:
+            raise ValueError(f"Source '{key}' has unknown link path {config['link'].get('path')!r}")
+        _check_template(key, config['link'].get('template'))
+        if not isinstance(config['notify_events'], list):
+            raise ValueError(f"Source '{key}': notify_events must be a list")
+        unknown = [event for event in config['notify_events'] if event not in EVENT_TYPES]
+        if unknown:
+            raise ValueError(f"Source '{key}' has unknown notify_events {', '.join(map(str, unknown))}")
+
+        config['key'] = key
+        try:
+            config['color'] = _parse_color(config['color'])
+        except ValueError:
+            raise ValueError(f"Source '{key}' has invalid color {config['color']!r}") from None
+        if 'webhook_url' not in config:
+            config['webhook_url'] = os.getenv(config['webhook_env']) if config.get('webhook_env') else None
+        config.setdefault('seen_file', f"seen_listings_{key}.log")
+        config.setdefault('legacy_seen_file', f"seen_listings_{key}.json")
+        config['parser'] = compile_parser(config)
+        sources[key] = config
+
+    return sources
+
+
+def load_config(path=SOURCES_FILE):
+    """Load sources and subscriptions from the config file and apply the subscriptions.
+
+    Returns (sources, subscriptions). Raises ValueError (or OSError) if the
+    file can't be read or is invalid, so a caller can keep its current config.
+    """
+    sources = load_sources(path)
+    subscriptions = load_subscriptions(path)
+    apply_subscriptions(sources, subscriptions)
+    return sources, subscriptions
+
+
+class ConfigWatcher:
+    """Notices edits of config files by polling their modification time and size."""
+
+    def __init__(self, paths):
+        self.paths = [path for path in paths if path]
+        self._state = self._stat()
+
+    def _stat(self):
+        state = []
+        for path in self.paths:
+            try:
+                info = os.stat(path)
+                state.append((info.st_mtime_ns, info.st_size))
+            except OSError:
+                state.append(None)
+        return state
+
+    def changed(self):
+        """Whether any file changed since the last call."""
+        state = self._stat()
+        if state == self._state:
+            return False
+        self._state = state
+        return True
+
+
+def _compile_path(path):
+    """Build a getter for a dotted API path such as 'pictures.0.url'."""
+    parts = tuple(int(part) if part.isdigit() else part for part in path.split('.'))
+    if len(parts) == 1:
+        key = parts[0]
+        return lambda item: item.get(key)
+
+    def get(item):
+        value = item
+        for part in parts:
+            try:
+                value = value[part]
+            except (KeyError, IndexError, TypeError):
+                return None
+        return value
+    return get
+
+
+def _compile_text(paths):
+    """Getter returning the first non-empty scalar at one of `paths`, as a string."""
+    getters = [_compile_path(path) for path in paths]
+
+    def get(item):
+        for getter in getters:
+            value = getter(item)
+            if value is not None and value != '' and not isinstance(value, (dict, list)):
+                return value if isinstance(value, str) else str(value)
+        return ''
+    return get
+
+
+def _compile_number(paths):
+    """Getter returning the first non-zero number at one of `paths`, or None."""
+    getters = [_compile_path(path) for path in paths]
+
+    def get(item):
+        for getter in getters:
+            value = getter(item)
+            if value:
+                try:
+                    return float(value)
+                except (TypeError, ValueError):
+                    continue
+        return None
+    return get
+
+
+# Mapped fields that are numbers rather than text
+NUMERIC_FIELDS = ('rent', 'area')
+
+# Mapped fields stored on their own Listing attribute
+LISTING_FIELDS = frozenset(
+    name for name in Listing.__dataclass_fields__ if name not in ('id', 'source', 'title', 'link', 'extra')
+)
+
+_NOT_SLUG = re.compile(r'[^a-z0-9]+')
+
+
+def compile_parser(source):
+    """Generate the item -> Listing parser of a source from its field mapping.
+
+    All path lookups and link building are resolved once here, so parsing an
+    item is a fixed sequence of getter calls.
+    """
+    mapping = source['fields']
+    street = _compile_text(mapping['street'])
+    house_number = _compile_text(mapping.get('house_number', ()))
+    addition = _compile_text(mapping.get('house_number_addition', ()))
+    city = _compile_text(mapping['city'])
+    postal_code = _compile_text(mapping['postal_code'])
+    rent = _compile_number(mapping.get('rent', ()))
+    area = _compile_number(mapping.get('area', ()))
+    image = _compile_text(mapping.get('image', ()))
+
+    skip = {'street', 'house_number', 'house_number_addition', 'city', 'postal_code', 'image', *NUMERIC_FIELDS}
+    attributes = [(name, _compile_text(paths)) for name, paths in mapping.items()
+                  if name not in skip and name in LISTING_FIELDS]
+    extras = [(name, _compile_text(paths)) for name, paths in mapping.items()
+              if name not in skip and name not in LISTING_FIELDS]
+
+    key = source['key']
+    base_url = source['base_url']
+    template = source['link']['template']
+    address_path = source['link']['path'] == 'address_parts'
+
+    def parse(item, timestamp):
+        street_value = street(item)
+        number_value = house_number(item)
+        addition_value = addition(item)
+        city_value = city(item)
+        postal_value = postal_code(item)
+
+        title = ' '.join(p for p in (street_value, number_value, addition_value) if p)
+        if postal_value or city_value:
+            title += f", {postal_value} {city_value}".strip()
+        if not title or title.isspace():
+            return None
+
+        listing_id = str(item.get('id', ''))
+        if address_path:
+            components = [listing_id]
+            if street_value:
+                components.append(street_value.lower().strip().replace(' ', ''))
+            if number_value:
+                components.append(number_value)
+            clean_addition = addition_value.strip().replace(' ', '')
+            if clean_addition:
+                components.append(clean_addition)
+            if city_value:
+                components.append(city_value.lower().strip().replace(' ', ''))
+            path = '-'.join(components)
+        else:
+            slug = _NOT_SLUG.sub('-', title.lower()).strip('-')
+            path = f"{listing_id}-{slug}" if slug else listing_id
+
+        img_url = image(item)
+        if img_url and not img_url.startswith(('http://', 'https://')):
+            img_url = base_url + img_url
+
+        listing = Listing(
+            id=listing_id,
+            source=key,
+            title=title,
+            link=template.format(path=path),
+            price=rent(item),
+            area=area(item),
+            img_url=img_url,
+            timestamp=timestamp,
+            street=street_value,
+            house_number=number_value,
+            house_number_addition=addition_value,
+            postal_code=postal_value,
+            city=city_value
+        )
+        for name, getter in attributes:
+            setattr(listing, name, getter(item))
+        if extras:
+            listing.extra = {name: getter(item) for name, getter in extras}
+        return listing
+
+    return parse
+
+
+def parse_item(source, item, timestamp=None):
+    """Turn a raw aanbod API item into a Listing. Returns None if it has no address."""
+    return source['parser'](item, timestamp if timestamp is not None else time.time())
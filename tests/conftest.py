@@ -0,0 +1,28 @@
+from aiohttp import web
+
+
+async def start_server(app):
+    """Serve an aiohttp app on a free local port. Returns (runner, base_url); call runner.cleanup() when done."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def start_webhooks(statuses=None):
+    """Webhooks answering POST /<name> with statuses[name] (default 204). Returns (runner, base_url, posts).
+
+    `posts` collects the (name, content type) of every request.
+    """
+    posts = []
+
+    async def handle(request):
+        name = request.match_info['name']
+        posts.append((name, request.content_type))
+        return web.Response(status=(statuses or {}).get(name, 204), text='{"message": "Unknown Webhook"}')
+
+    app = web.Application()
+    app.router.add_post('/{name}', handle)
+    runner, base_url = await start_server(app)
+    return runner, base_url, posts
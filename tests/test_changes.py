@@ -0,0 +1,89 @@
+import pytest
+
+from changes import ADDED, CHANGED, REMOVED, ChangeTracker, ListingEvent, apply_event
+from listing import Listing
+from seen_store import SeenStore
+
+
+def listing(listing_id, price=500.0):
+    return Listing(id=listing_id, source='plaza', title=f"Street {listing_id}", link='', price=price)
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    store = SeenStore(str(tmp_path / 'seen.log')).load()
+    yield ChangeTracker(store)
+    store.close()
+
+
+def walk(tracker, pages):
+    """One cycle over `pages` (lists of listings, or None for an unchanged page); new ones are recorded as seen."""
+    tracker.start_cycle()
+    for page, listings in enumerate(pages):
+        for item in listings or ():
+            if item.id not in tracker.store:
+                apply_event(tracker.store, ListingEvent(ADDED, item))
+        tracker.record_page(page, listings)
+
+
+def test_listing_missing_from_a_complete_walk_is_removed(tracker):
+    walk(tracker, [[listing('1'), listing('2')]])
+    walk(tracker, [[listing('1')]])
+    events = tracker.removed(max_pages=10)
+    assert [(event.kind, event.listing.id) for event in events] == [(REMOVED, '2')]
+    assert not tracker.store.is_gone('2')
+    apply_event(tracker.store, events[0])
+    assert tracker.store.is_gone('2')
+
+
+def test_unchanged_page_counts_as_present(tracker):
+    walk(tracker, [[listing('1')], [listing('2')]])
+    walk(tracker, [None, [listing('2')]])
+    assert tracker.removed(max_pages=10) == []
+
+
+@pytest.mark.parametrize('cut_off', ['incomplete', 'max_pages', 'empty'])
+def test_no_removals_after_a_partial_or_empty_walk(tracker, cut_off):
+    walk(tracker, [[listing('1')], [listing('2')]])
+    if cut_off == 'incomplete':
+        walk(tracker, [[listing('1')]])
+        tracker.mark_incomplete()
+    elif cut_off == 'max_pages':
+        walk(tracker, [[listing('1')]])
+    else:
+        walk(tracker, [[]])
+    assert tracker.removed(max_pages=1 if cut_off == 'max_pages' else 10) == []
+    assert not tracker.store.is_gone('2')
+
+
+def test_listing_this_process_never_parsed_is_marked_gone_silently(tracker):
+    tracker.store.add('9', fingerprint='0', price=1.0)
+    walk(tracker, [[listing('1')]])
+    assert tracker.removed(max_pages=10) == []
+    assert tracker.store.is_gone('9')
+
+
+def test_reset_marks_missing_listings_gone_without_events(tracker):
+    walk(tracker, [[listing('1'), listing('2')]])
+    tracker.reset()
+    walk(tracker, [[listing('1')]])
+    assert tracker.removed(max_pages=10) == []
+    assert tracker.store.is_gone('2')
+
+
+def test_diff_reports_price_changes_and_relistings(tracker):
+    walk(tracker, [[listing('1', 500.0), listing('2')]])
+    event = tracker.diff(listing('1', 450.0))
+    assert (event.kind, event.changes, event.previous_price) == (CHANGED, ('price',), 500.0)
+    assert tracker.diff(listing('2')) is None
+
+    tracker.store.mark_gone('2')
+    event = tracker.diff(listing('2'))
+    assert (event.kind, event.relisted) == (ADDED, True)
+
+
+def test_listed_includes_later_pages_after_an_early_stop(tracker):
+    walk(tracker, [[listing('1')], [listing('2')]])
+    walk(tracker, [None])
+    tracker.mark_incomplete()
+    assert tracker.listed() == {'1', '2'}
@@ -0,0 +1,39 @@
+import pytest
+
+from fetcher import CircuitBreaker, CircuitOpenError
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+    breaker.record_failure(now=0)
+    breaker.record_failure(now=1)
+    breaker.check(now=2)
+    breaker.record_failure(now=2)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.check(now=10)
+    assert raised.value.retry_after == pytest.approx(52)
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    breaker.record_failure(now=0)
+    breaker.record_success()
+    breaker.record_failure(now=1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_closes_or_reopens():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+    breaker.record_failure(now=100)
+    breaker.check(now=160)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure(now=161)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check(now=200)
+
+    breaker.check(now=221)
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.check(now=222)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from changes import ADDED, ListingEvent, apply_event
+from dwellings import DwellingIndex, webhook_digest
+from filters import RuleIndex
+from listing import Listing, address_key
+from router import Router
+from scraper import process_scraper
+from seen_store import SeenStore
+
+
+def address(street='Hoofdstraat', house_number='1', addition='', postal_code='7511 GA', city='Enschede'):
+    return Listing(id='1', source='plaza', title='', link='', street=street, house_number=house_number,
+                   house_number_addition=addition, postal_code=postal_code, city=city)
+
+
+def test_address_key_ignores_spelling_differences():
+    assert address_key(address(addition='K12', postal_code='7514 AE')) == \
+        address_key(address(street='hoofdstraat ', addition='k 12', postal_code='7514ae'))
+
+
+def test_address_key_tells_dwellings_apart():
+    keys = {address_key(listing) for listing in (
+        address(), address(house_number='2'), address(addition='A'), address(postal_code='7511 GB')
+    )}
+    assert len(keys) == 4
+
+
+def test_address_key_needs_postal_code_and_house_number():
+    # "Hoofdstraat 1" exists in many cities
+    assert address_key(address(postal_code='', city='Enschede')) is None
+    assert address_key(address(house_number='')) is None
+
+
+def test_index_forgets_gone_and_evicted_listings(tmp_path):
+    plaza = SeenStore(str(tmp_path / 'plaza.log'), ttl_days=1).load()
+    roomspot = SeenStore(str(tmp_path / 'roomspot.log')).load()
+    sending = {}
+    index = DwellingIndex(lambda source_key, listing_id: sending.get((source_key, listing_id), set()))
+    index.attach('plaza', {'name': 'Plaza'}, plaza)
+    index.attach('roomspot', {'name': 'Roomspot'}, roomspot)
+
+    first, second = address(), address(house_number='2')
+    for listing in (first, second):
+        listing.id = listing.house_number
+        key = index.add('plaza', listing)
+        # Still being announced: not in the store yet, but it counts
+        sending[('plaza', listing.id)] = {'https://discord/w'}
+        assert index.others('roomspot', key) == [({'name': 'Plaza'}, '', {webhook_digest('https://discord/w')})]
+        sending.clear()
+        apply_event(plaza, ListingEvent(ADDED, listing, sent=(webhook_digest('https://discord/w'),)))
+
+    plaza.mark_gone(first.id)
+    assert index.others('roomspot', address_key(first)) == []
+
+    plaza.touch(second.id, time.time() - 2 * 86400)
+    assert plaza.maintain() == 1
+    index.prune('plaza')
+    assert len(index) == 0
+    plaza.close()
+
+
+def test_index_is_rebuilt_from_the_seen_stores(tmp_path):
+    store = SeenStore(str(tmp_path / 'plaza.log')).load()
+    listing = address()
+    listing.link = 'https://plaza/1'
+    apply_event(store, ListingEvent(ADDED, listing, sent=(webhook_digest('https://discord/w'),)))
+    store.close()
+
+    index = DwellingIndex()
+    index.attach('plaza', {'name': 'Plaza'}, SeenStore(str(tmp_path / 'plaza.log')).load())
+    assert index.others('roomspot', address_key(listing)) == [
+        ({'name': 'Plaza'}, 'https://plaza/1', {webhook_digest('https://discord/w')})
+    ]
+
+
+class FakeDispatcher:
+    """Queues notifications until `deliver` is called."""
+
+    def __init__(self):
+        self.queued = []
+
+    def is_dead(self, url):
+        return False
+
+    def submit(self, url, key, embed, on_delivered=None, on_failed=None, on_dropped=None):
+        self.queued.append((url, on_delivered))
+
+    def deliver(self):
+        queued, self.queued = self.queued, []
+        for _, on_delivered in queued:
+            on_delivered()
+        return [url for url, _ in queued]
+
+
+class FakePages:
+    """Page source serving one page per source."""
+
+    def __init__(self):
+        self.listings = {}
+
+    async def walk(self, session, scraper_name, scraper_config):
+        yield 0, self.listings[scraper_name]
+
+    def forget(self, api_url):
+        pass
+
+
+def run_cycles(tmp_path, subscription, cycles):
+    """Scrape `cycles` [(source, price)] with one subscription; the webhooks notified in each cycle."""
+    router = Router(FakeDispatcher())
+    index = DwellingIndex(router.sending)
+    pages = FakePages()
+    sources = {}
+    stores = {}
+    for key in ('plaza', 'roomspot'):
+        sources[key] = {'key': key, 'name': key.title(), 'emoji': '', 'color': 0, 'api_url': key, 'sort': '',
+                        'notify_events': [ADDED], 'webhook_url': None, 'subscriptions': [subscription],
+                        'rule_index': RuleIndex([subscription])}
+        stores[key] = SeenStore(str(tmp_path / f"{key}.log")).load()
+        index.attach(key, sources[key], stores[key])
+
+    notified = []
+    for key, price in cycles:
+        listing = address()
+        listing.source, listing.id, listing.price = key, f"{key}-1", price
+        pages.listings[key] = [listing]
+        asyncio.run(process_scraper(None, router, key, sources[key], stores[key], page_source=pages,
+                                    dwellings=index))
+        notified.append(router.dispatcher.deliver())
+    return notified
+
+
+def test_dwelling_is_announced_once_per_webhook(tmp_path):
+    subscription = {'name': 'cheap', 'max_rent': 650, 'webhook': 'https://discord/w'}
+    assert run_cycles(tmp_path, subscription, [('plaza', 600), ('roomspot', 640)]) == [['https://discord/w'], []]
+
+
+def test_dwelling_filtered_on_one_source_is_announced_from_another(tmp_path):
+    subscription = {'name': 'cheap', 'max_rent': 650, 'webhook': 'https://discord/w'}
+    assert run_cycles(tmp_path, subscription, [('plaza', 700), ('roomspot', 640)]) == [[], ['https://discord/w']]
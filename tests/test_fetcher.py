@@ -0,0 +1,61 @@
+import asyncio
+import json
+import urllib.parse
+
+import fetcher
+from fetcher import forget_pages, iter_pages
+
+API_URL = 'https://api.test/aanbod'
+
+
+def serve_pages(monkeypatch, pages, on_request=None):
+    """Answer page requests with `pages` (lists of items) instead of the network. Returns the requested pages."""
+    requested = []
+
+    async def post(session, url, payload, headers, description):
+        page = int(urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)['page'][0])
+        requested.append(page)
+        if on_request:
+            on_request(page)
+        return 200, json.dumps({'data': pages[page]}).encode(), None, None
+
+    monkeypatch.setattr(fetcher, '_post_hedged', post)
+    return requested
+
+
+def walk(stop_after=None):
+    """Pages (number, items) of one walk, stopping after page `stop_after`."""
+    async def consume():
+        seen = []
+        pages = iter_pages(None, API_URL, {}, {}, page_size=2, max_pages=3, concurrency=1)
+        try:
+            async for page, items in pages:
+                seen.append((page, items))
+                if page == stop_after:
+                    break
+        finally:
+            await pages.aclose()
+        return seen
+    return asyncio.run(consume())
+
+
+def test_forget_during_an_unchanged_fetch(monkeypatch):
+    forget_pages(API_URL)
+    serve_pages(monkeypatch, [[1, 2], [3]])
+    assert walk() == [(0, [1, 2]), (1, [3])]
+
+    # A failed notification forgets the endpoint while its page is being fetched
+    serve_pages(monkeypatch, [[1, 2], [3]], on_request=lambda page: page == 0 and forget_pages(API_URL))
+    assert walk() == [(0, None), (1, [3])]
+    # Pages fetched before the forget are not remembered after it
+    assert walk() == [(0, [1, 2]), (1, [3])]
+
+
+def test_page_the_caller_stopped_after_is_remembered(monkeypatch):
+    forget_pages(API_URL)
+    requested = serve_pages(monkeypatch, [[1, 2], [3, 4], [5]])
+    # Newest-first walks stop at the first page without new listings
+    assert walk(stop_after=0) == [(0, [1, 2])]
+    assert walk(stop_after=0) == [(0, None)]
+    assert walk() == [(0, None), (1, [3, 4]), (2, [5])]
+    assert requested == [0, 0, 0, 1, 2]
@@ -0,0 +1,73 @@
+import random
+
+from filters import RuleIndex
+from listing import Listing
+
+
+def matches(subscription, listing):
+    """One subscription's rules, checked the straightforward way."""
+    if 'max_rent' in subscription and listing.price is not None and listing.price > subscription['max_rent']:
+        return False
+    if 'min_area' in subscription and listing.area is not None and listing.area < subscription['min_area']:
+        return False
+    if subscription.get('dwelling_types') and listing.property_type.strip().lower() not in [
+            value.strip().lower() for value in subscription['dwelling_types']]:
+        return False
+    if subscription.get('floors') and listing.floor.strip().lower() not in [
+            value.strip().lower() for value in subscription['floors']]:
+        return False
+    if subscription.get('postal_prefixes'):
+        postal = listing.postal_code.replace(' ', '').upper()
+        if not any(postal.startswith(prefix.replace(' ', '').upper()) for prefix in subscription['postal_prefixes']):
+            return False
+    if subscription.get('street_keywords'):
+        words = listing.street.lower().replace("'", ' ').split()
+        if not any(word.startswith(keyword.lower()) for word in words for keyword in subscription['street_keywords']):
+            return False
+    return True
+
+
+def random_subscription(rng):
+    subscription = {}
+    if rng.random() < 0.5:
+        subscription['max_rent'] = rng.choice([400, 500, 612.45, 800])
+    if rng.random() < 0.4:
+        subscription['min_area'] = rng.choice([10, 20, 24, 40])
+    if rng.random() < 0.3:
+        subscription['dwelling_types'] = rng.sample(['Studio', 'room', ' Apartment '], rng.randint(1, 2))
+    if rng.random() < 0.2:
+        subscription['floors'] = rng.sample(['Ground floor', '2nd floor'], 1)
+    if rng.random() < 0.3:
+        subscription['postal_prefixes'] = rng.sample(['75', '7511', '7522 N', '7514AE'], rng.randint(1, 2))
+    if rng.random() < 0.3:
+        subscription['street_keywords'] = rng.sample(['calslaan', 'markt', 'oude', 'hof'], rng.randint(1, 2))
+    return subscription
+
+
+def random_listing(rng, i):
+    return Listing(
+        id=str(i), source='plaza', title='', link='',
+        price=rng.choice([None, 350.0, 500.0, 612.45, 700.0, 1000.0]),
+        area=rng.choice([None, 12.0, 20.0, 24.0, 60.0]),
+        property_type=rng.choice(['Studio', 'Room', 'Apartment', '']),
+        floor=rng.choice(['Ground floor', '2nd floor', '']),
+        postal_code=rng.choice(['7511 GA', '7514 AE', '7522 NB', '1011 AB', '']),
+        street=rng.choice(['Oude Markt', 'Calslaan', "Van 't Hofflaan", 'Hengelosestraat', ''])
+    )
+
+
+def test_match_mask_agrees_with_each_rule_checked_separately():
+    rng = random.Random(3)
+    for _ in range(20):
+        subscriptions = [random_subscription(rng) for _ in range(rng.randint(1, 70))]
+        index = RuleIndex(subscriptions)
+        for i in range(200):
+            listing = random_listing(rng, i)
+            expected = sum(1 << n for n, subscription in enumerate(subscriptions) if matches(subscription, listing))
+            assert index.match_mask(listing) == expected, (listing, subscriptions)
+
+
+def test_unknown_price_and_area_are_not_filtered():
+    index = RuleIndex([{'max_rent': 500}, {'min_area': 30}])
+    listing = Listing(id='1', source='plaza', title='', link='')
+    assert index.match(listing) == index.subscriptions
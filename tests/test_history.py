@@ -0,0 +1,56 @@
+import history_cli
+from history import ListingHistory
+from listing import Listing
+
+
+def listing(listing_id, price, city='Enschede', publication_date=''):
+    return Listing(id=listing_id, source='plaza', title=f"Street {listing_id}", link='', price=price, area=50.0,
+                   city=city, property_type='Studio', publication_date=publication_date)
+
+
+def rows(history):
+    return {row[0]: row[1:] for row in history.connection.execute(
+        "SELECT id, price, first_seen, last_seen, removed_at FROM listings ORDER BY id"
+    )}
+
+
+def test_record_cycle_tracks_first_seen_last_seen_and_removal(tmp_path):
+    history = ListingHistory(str(tmp_path / 'history.db'))
+    history.record_cycle('plaza', [listing('1', 500.0), listing('2', 600.0)], timestamp=100)
+    # Listing 1 changed price, 2 sits on an unchanged page
+    history.record_cycle('plaza', [listing('1', 550.0)], present_ids={'1', '2'}, timestamp=200)
+    assert rows(history) == {'1': (550.0, 100, 200, None), '2': (600.0, 100, 200, None)}
+
+    history.record_cycle('plaza', [], removed_ids=['2'], timestamp=300)
+    history.record_cycle('plaza', [], removed_ids=['2'], timestamp=400)
+    assert rows(history)['2'] == (600.0, 100, 200, 300)
+
+    # Back online
+    history.record_cycle('plaza', [listing('2', 600.0)], timestamp=500)
+    assert rows(history)['2'] == (600.0, 100, 500, None)
+    history.close()
+
+
+def test_cli_queries(tmp_path, capsys):
+    path = str(tmp_path / 'history.db')
+    history = ListingHistory(path)
+    history.record_cycle('plaza', [
+        listing('1', 500.0, publication_date='2024-05-06T09:00:00Z'),
+        listing('2', 700.0, city='Hengelo', publication_date='2024-05-06T09:30:00Z'),
+    ], timestamp=1714986000)
+    history.record_cycle('plaza', [], removed_ids=['1'], timestamp=1714986000 + 2 * 86400)
+    history.close()
+
+    history_cli.main(['summary', '--db', path])
+    assert capsys.readouterr().out.splitlines()[1].split()[:4] == ['plaza', '2', '1', '1']
+
+    history_cli.main(['market-time', '--db', path])
+    assert capsys.readouterr().out.splitlines()[1].split() == ['plaza', '1', '2.0', '2.0', '2.0']
+
+    history_cli.main(['prices', '--db', path, '--all'])
+    assert [line.split()[:3] for line in capsys.readouterr().out.splitlines()[1:]] == [
+        ['Enschede', '1', '€500'], ['Hengelo', '1', '€700']
+    ]
+
+    history_cli.main(['busy-hours', '--db', path])
+    assert capsys.readouterr().out.splitlines()[1].split() == ['Mon', '09:00', '2']
@@ -0,0 +1,92 @@
+import asyncio
+
+from aiohttp import web
+
+from conftest import start_server, start_webhooks
+from http_session import create_session
+from notifier import NotificationDispatcher
+import thumbnails
+
+
+class BrokenThumbnailer:
+    """Prefetches that fail the way Pillow can on a malformed image."""
+
+    def prefetch(self, url):
+        async def fail():
+            raise SyntaxError('not a JPEG file')
+        return asyncio.ensure_future(fail())
+
+
+def run_dispatcher(scenario, **options):
+    async def main():
+        runner, base_url, posts = await start_webhooks()
+        outcomes = []
+        try:
+            async with create_session() as session:
+                dispatcher = NotificationDispatcher(session, **options)
+                await scenario(dispatcher, f"{base_url}/webhook", outcomes)
+                await asyncio.wait_for(dispatcher.join(), 10)
+                await dispatcher.close()
+        finally:
+            await runner.cleanup()
+        return outcomes, posts
+    return asyncio.run(main())
+
+
+def submit(dispatcher, url, key, outcomes, embed=None):
+    dispatcher.submit(url, key, embed or {'title': str(key)},
+                      on_delivered=lambda: outcomes.append(('delivered', key)),
+                      on_failed=lambda: outcomes.append(('failed', key)))
+
+
+def test_failed_thumbnail_falls_back_to_the_image_url():
+    async def scenario(dispatcher, url, outcomes):
+        submit(dispatcher, url, 1, outcomes, {'title': '1', 'image': {'url': 'http://127.0.0.1:9/1.jpg'}})
+
+    outcomes, posts = run_dispatcher(scenario, thumbnailer=BrokenThumbnailer())
+    assert outcomes == [('delivered', 1)]
+    assert posts == [('webhook', 'application/json')]
+
+
+def test_unexpected_error_fails_the_batch_and_keeps_the_worker():
+    async def scenario(dispatcher, url, outcomes):
+        original = dispatcher._thumbnails
+        calls = []
+
+        async def thumbnails(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+            return await original(batch)
+
+        dispatcher._thumbnails = thumbnails
+        dispatcher.workers_per_webhook = 1
+        submit(dispatcher, url, 1, outcomes)
+        await dispatcher.join()
+        submit(dispatcher, url, 2, outcomes)
+
+    outcomes, posts = run_dispatcher(scenario)
+    assert outcomes == [('failed', 1), ('delivered', 2)]
+
+
+def test_thumbnailer_returns_none_on_any_image_error(tmp_path, monkeypatch):
+    def downscale(data, size):
+        raise SyntaxError('not a JPEG file')
+
+    monkeypatch.setattr(thumbnails, 'downscale', downscale)
+
+    async def main():
+        async def image(request):
+            return web.Response(body=b'\xff\xd8garbage', content_type='image/jpeg')
+
+        app = web.Application()
+        app.router.add_get('/1.jpg', image)
+        runner, base_url = await start_server(app)
+        try:
+            async with create_session() as session:
+                thumbnailer = thumbnails.Thumbnailer(session, thumbnails.ThumbnailCache(str(tmp_path), 1024 * 1024))
+                return await thumbnailer.prefetch(f"{base_url}/1.jpg")
+        finally:
+            await runner.cleanup()
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,159 @@
+"""The generic parser against the per-source parsers it replaced, on the fixtures and randomised items."""
+import copy
+import json
+import os
+import random
+import re
+
+import pytest
+
+from listing import format_area, format_price
+from sources import load_sources, parse_item
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+FIXTURE_DIR = os.path.join(ROOT, 'bench', 'fixtures')
+
+
+def _text_fields(item):
+    return item.get('street', ''), item.get('houseNumber', ''), item.get('houseNumberAddition', '')
+
+
+def _title(street, house_number, addition, postal_code, city):
+    title = ' '.join(p for p in [street, house_number, addition] if p)
+    if postal_code or city:
+        title += f", {postal_code} {city}".strip()
+    return title
+
+
+def _price_area_image(item, base_url):
+    if item.get('totalRent'):
+        price = f"€{float(item['totalRent']):.2f}"
+    elif item.get('netRent'):
+        price = f"€{float(item['netRent']):.2f}"
+    else:
+        price = 'No price info'
+    area = f"{item['areaDwelling']} m²" if item.get('areaDwelling') else 'No area info'
+    img_url = ''
+    if item.get('pictures'):
+        picture = item['pictures'][0]
+        if isinstance(picture, dict) and 'url' in picture:
+            img_url = picture['url']
+        elif isinstance(picture, dict) and 'uri' in picture:
+            img_url = picture['uri']
+    if img_url and not img_url.startswith(('http://', 'https://')):
+        img_url = f"{base_url}{img_url}"
+    return price, area, img_url
+
+
+def legacy_plaza(item):
+    """Item handling of the original get_plaza_listings."""
+    listing_id = str(item.get('id', ''))
+    street, house_number, addition = _text_fields(item)
+    city = item['city'].get('name', '') if isinstance(item.get('city'), dict) else item.get('city', '')
+    title = _title(street, house_number, addition, item.get('postalcode', ''), city)
+    price, area, img_url = _price_area_image(item, 'https://plaza.newnewnew.space')
+    if isinstance(item.get('dwellingType'), dict):
+        property_type = item['dwellingType'].get('name', '')
+    else:
+        property_type = item.get('objectType', '')
+    floor = item['floor'].get('name', '') if isinstance(item.get('floor'), dict) else ''
+    slug = re.sub(r'-+', '-', re.sub(r'[^a-z0-9]', '-', title.lower())).strip('-')
+    link = f"https://plaza.newnewnew.space/en/availables-places/living-place/details/{listing_id}"
+    if slug:
+        link += f"-{slug}"
+    if not title or title.isspace():
+        return None
+    return {'id': listing_id, 'title': title, 'price': price, 'area': area, 'property_type': property_type,
+            'floor': floor, 'link': link, 'img_url': img_url, 'publication_date': item.get('publicationDate', '')}
+
+
+def legacy_roomspot(item):
+    """Item handling of the original get_roomspot_listings."""
+    listing_id = str(item.get('id', ''))
+    street, house_number, addition = _text_fields(item)
+    city = item.get('gemeenteGeoLocatieNaam', '')
+    title = _title(street, house_number, addition, item.get('postalcode', ''), city)
+    price, area, img_url = _price_area_image(item, 'https://www.roomspot.nl')
+    if isinstance(item.get('dwellingType'), dict):
+        property_type = item['dwellingType'].get('localizedName', '')
+    else:
+        property_type = item.get('objectType', '')
+    if isinstance(item.get('woningsoort'), dict):
+        house_type = item['woningsoort'].get('localizedNaam', '')
+    else:
+        house_type = item['toewijzingModelCategorie'].get('code', '')
+    components = [listing_id]
+    if street:
+        components.append(street.lower().strip().replace(' ', ''))
+    if house_number:
+        components.append(str(house_number))
+    if addition and str(addition).strip().replace(' ', ''):
+        components.append(str(addition).strip().replace(' ', ''))
+    if city:
+        components.append(city.lower().strip().replace(' ', ''))
+    link = f"https://www.roomspot.nl/en/housing-offer/to-rent/translate-to-engels-details/{'-'.join(components)}"
+    if not title or title.isspace():
+        return None
+    return {'id': listing_id, 'title': title, 'price': price, 'area': area, 'property_type': property_type,
+            'house_type': house_type, 'link': link, 'img_url': img_url,
+            'publication_date': item.get('publicationDate', '')}
+
+
+LEGACY = {'plaza': legacy_plaza, 'roomspot': legacy_roomspot}
+
+
+def fixture_items(key):
+    with open(os.path.join(FIXTURE_DIR, f"aanbod_{key}.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)['data']
+
+
+def randomised_items(key, count, seed=7):
+    """Fixture items with their address, rent, area and pictures varied (including missing values)."""
+    rng = random.Random(seed)
+    templates = fixture_items(key)
+    items = []
+    for i in range(count):
+        item = copy.deepcopy(templates[i % len(templates)])
+        item['id'] = 200000 + i
+        item['houseNumber'] = rng.choice(['1', '12', '250', ''])
+        item['houseNumberAddition'] = rng.choice(['', 'A', 'K12', 'A 3', ' b '])
+        item['street'] = rng.choice(['Oude Markt', "Van 't Hofflaan", 'Calslaan', ''])
+        item['postalcode'] = rng.choice(['7511 GA', '7522NB', ''])
+        for rent in ('totalRent', 'netRent'):
+            item[rent] = rng.choice([None, 0, 450, 612.45, 1033.5])
+        item['areaDwelling'] = rng.choice([None, 0, 14, 24, 61])
+        item['pictures'] = rng.choice([
+            [], [{'uri': f"/img/{i}.jpg"}], [{'url': f"https://cdn.example/{i}.jpg"}], [{'label': ''}]
+        ])
+        items.append(item)
+    return items
+
+
+@pytest.fixture(scope='module')
+def sources():
+    return load_sources(os.path.join(ROOT, 'sources.json'))
+
+
+@pytest.mark.parametrize('key', ['plaza', 'roomspot'])
+def test_generic_parser_matches_legacy_parsers(sources, key):
+    source = sources[key]
+    items = fixture_items(key) + randomised_items(key, 500)
+    for item in items:
+        expected = LEGACY[key](item)
+        listing = parse_item(source, item)
+        if expected is None:
+            assert listing is None, item
+            continue
+        assert listing is not None, item
+        parsed = {
+            'id': listing.id,
+            'title': listing.title,
+            'price': format_price(listing.price),
+            'area': format_area(listing.area),
+            'property_type': listing.property_type,
+            'link': listing.link,
+            'img_url': listing.img_url,
+            'publication_date': listing.publication_date,
+            'floor' if key == 'plaza' else 'house_type': listing.floor if key == 'plaza' else listing.house_type
+        }
+        assert parsed == expected, item
@@ -0,0 +1,36 @@
+import asyncio
+
+from conftest import start_webhooks
+from filters import RuleIndex
+from http_session import create_session
+from listing import Listing
+from notifier import NotificationDispatcher
+from router import Router
+
+
+def test_dead_webhook_is_dropped_from_the_fan_out():
+    async def scenario():
+        runner, base_url, posts = await start_webhooks({'ok': 204, 'gone': 404})
+        source = {'key': 'plaza', 'webhook_url': None, 'rule_index': RuleIndex([
+            {'webhook': f"{base_url}/gone"}, {'webhook': f"{base_url}/ok"}
+        ])}
+        outcomes = []
+        try:
+            async with create_session() as session:
+                dispatcher = NotificationDispatcher(session)
+                router = Router(dispatcher)
+                for listing_id in ('1', '2'):
+                    router.route(source, Listing(id=listing_id, source='plaza', title='', link=''),
+                                 lambda listing, source: {'title': listing.id},
+                                 on_delivered=lambda _, listing_id=listing_id: outcomes.append(('delivered', listing_id)),
+                                 on_failed=lambda listing_id=listing_id: outcomes.append(('failed', listing_id)))
+                    await dispatcher.join()
+                await dispatcher.close()
+        finally:
+            await runner.cleanup()
+        return outcomes, posts
+
+    outcomes, posts = asyncio.run(scenario())
+    assert outcomes == [('delivered', '1'), ('delivered', '2')]
+    # The dead webhook is only contacted once
+    assert sorted(name for name, _ in posts) == ['gone', 'ok', 'ok']
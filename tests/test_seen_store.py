@@ -0,0 +1,58 @@
+import json
+import time
+
+from seen_store import SeenStore
+
+
+def test_log_survives_reload(tmp_path):
+    path = str(tmp_path / 'seen.log')
+    store = SeenStore(path).load()
+    store.add('1', fingerprint='aa', price=500.0)
+    store.add('2')
+    store.set_snapshot('1', 'bb', 450.0)
+    store.mark_gone('2')
+    store.close()
+
+    store = SeenStore(path).load()
+    assert '1' in store and '2' in store
+    assert store.snapshot('1') == ('bb', 450.0)
+    assert store.is_gone('2')
+    assert store.live_ids() == ['1']
+    store.close()
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / 'seen.log'
+    path.write_text(json.dumps({'id': '1', 'ts': time.time()}) + '\n{"id": "2", "t')
+    store = SeenStore(str(path)).load()
+    assert len(store) == 1 and '1' in store
+
+
+def test_compact_keeps_one_line_per_live_id(tmp_path):
+    path = tmp_path / 'seen.log'
+    store = SeenStore(str(path)).load()
+    for i in range(5):
+        store.add('1', fingerprint=str(i))
+    store.add('2')
+    store.compact()
+    store.close()
+    assert len(path.read_text().splitlines()) == 2
+    assert not (tmp_path / 'seen.log.tmp').exists()
+    assert SeenStore(str(path)).load().snapshot('1') == ('4', None)
+
+
+def test_expired_ids_are_dropped_on_load(tmp_path):
+    path = tmp_path / 'seen.log'
+    old = time.time() - 10 * 86400
+    path.write_text(json.dumps({'id': 'old', 'ts': old}) + '\n' + json.dumps({'id': 'new', 'ts': time.time()}) + '\n')
+    store = SeenStore(str(path), ttl_days=5).load()
+    assert 'old' not in store and 'new' in store
+
+
+def test_legacy_json_is_migrated(tmp_path):
+    legacy = tmp_path / 'seen_listings_plaza.json'
+    legacy.write_text(json.dumps(['1', '2']))
+    store = SeenStore(str(tmp_path / 'seen.log'), legacy_file=str(legacy)).load()
+    assert len(store) == 2
+    store.close()
+    assert len(SeenStore(str(tmp_path / 'seen.log')).load()) == 2
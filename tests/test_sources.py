@@ -0,0 +1,50 @@
+import json
+import os
+
+import pytest
+
+from sources import load_config
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+def write_config(tmp_path, edit):
+    with open(os.path.join(ROOT, 'sources.json'), encoding='utf-8') as f:
+        raw = json.load(f)
+    edit(raw)
+    path = tmp_path / 'sources.json'
+    path.write_text(json.dumps(raw))
+    return str(path)
+
+
+def test_shipped_config_loads(tmp_path):
+    sources, _ = load_config(write_config(tmp_path, lambda raw: None))
+    assert set(sources) == {'plaza', 'roomspot'}
+
+
+@pytest.mark.parametrize('edit', [
+    lambda raw: raw.update(sources=[]),
+    lambda raw: raw.update(defaults='sort'),
+    lambda raw: raw['sources'].update(plaza='plaza'),
+    lambda raw: raw['sources']['plaza']['link'].pop('template'),
+    lambda raw: raw['sources']['plaza']['link'].update(template='https://plaza/{id}'),
+    lambda raw: raw['sources']['plaza']['link'].update(template='https://plaza/{path'),
+    lambda raw: raw['sources']['plaza'].update(webhook_env=['PLAZA']),
+    lambda raw: raw['sources']['plaza'].update(notify_events='added'),
+    lambda raw: raw.update(subscriptions={'name': 'cheap'}),
+    lambda raw: raw.update(subscriptions=['cheap']),
+    lambda raw: raw.update(subscriptions=[{'name': 'cheap', 'webhook_env': 42}]),
+], ids=[
+    'sources-list', 'defaults-string', 'source-string', 'no-template', 'unknown-placeholder', 'broken-template',
+    'webhook-env-list', 'notify-events-string', 'subscriptions-object', 'subscription-string', 'webhook-env-number',
+])
+def test_bad_edit_is_rejected_with_value_error(tmp_path, edit):
+    with pytest.raises(ValueError):
+        load_config(write_config(tmp_path, edit))
+
+
+def test_non_object_file_is_rejected(tmp_path):
+    path = tmp_path / 'sources.json'
+    path.write_text('[]')
+    with pytest.raises(ValueError):
+        load_config(str(path))
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from metrics import Histogram, register_stats
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Largest width/height of a thumbnail in pixels, and its JPEG quality
+THUMBNAIL_SIZE = 480
+THUMBNAIL_QUALITY = 80
+
+# Originals larger than this are not downloaded
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+
+# Image URLs remembered with their content hash, so a known URL is served from disk without a request
+MAX_REMEMBERED_URLS = 10000
+
+IMAGE_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5, sock_read=10)
+
+# Cache hits, downloaded and failed images, and thumbnails evicted from the disk cache
+THUMBNAIL_STATS = {
+    'hits': 0,
+    'fetched': 0,
+    'failed': 0,
+    'evicted': 0
+}
+register_stats('scraper_thumbnails', THUMBNAIL_STATS, 'Thumbnail cache outcomes, see thumbnails.THUMBNAIL_STATS')
+
+THUMBNAIL_SECONDS = Histogram('scraper_thumbnail_seconds', 'Time to download and downscale one listing image')
+
+
+def available():
+    """Whether Pillow is installed."""
+    return Image is not None
+
+
+def downscale(data, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Shrink an image to fit in size x size pixels and encode it as JPEG."""
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder skip most of the pixels of a large original
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """Thumbnails on disk, named by the content hash of their original image.
+
+    The directory is bounded to `max_bytes`; the least recently used
+    thumbnails are deleted first (a cache hit refreshes the file's mtime).
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._files = OrderedDict()
+        self._size = 0
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith('.jpg'):
+                info = entry.stat()
+                entries.append((info.st_mtime, entry.name, info.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._size += size
+
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def get(self, digest):
+        """The cached thumbnail for a content hash, or None."""
+        name = f"{digest}.jpg"
+        if name not in self._files:
+            return None
+        try:
+            with open(self.path(digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._size -= self._files.pop(name)
+            return None
+        self._files.move_to_end(name)
+        os.utime(self.path(digest))
+        return data
+
+    def put(self, digest, data):
+        name = f"{digest}.jpg"
+        tmp_path = f"{self.path(digest)}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(digest))
+        self._size += len(data) - self._files.pop(name, 0)
+        self._files[name] = len(data)
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._size -= size
+            THUMBNAIL_STATS['evicted'] += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class Thumbnailer:
+    """Downloads listing images and turns them into small cached thumbnails.
+
+    `prefetch` starts the work in the background and returns a task that
+    resolves to (filename, JPEG bytes), or None if the image can't be had.
+    At most `concurrency` images are downloaded and downscaled at a time, and
+    the same URL is only ever fetched once at a time.
+    """
+
+    def __init__(self, session, cache, concurrency=4, size=THUMBNAIL_SIZE):
+        self.session = session
+        self.cache = cache
+        self.size = size
+        self._limiter = asyncio.Semaphore(concurrency)
+        self._inflight = {}
+        self._digests = OrderedDict()
+
+    def prefetch(self, url):
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._thumbnail(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return task
+
+    async def close(self):
+        """Cancel the prefetches still running; call it before closing the session."""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _thumbnail(self, url):
+        digest = self._digests.get(url)
+        if digest is not None:
+            data = self.cache.get(digest)
+            if data is not None:
+                THUMBNAIL_STATS['hits'] += 1
+                self._digests.move_to_end(url)
+                return f"{digest}.jpg", data
+
+        async with self._limiter:
+            start = time.perf_counter()
+            try:
+                async with self.session.get(url, timeout=IMAGE_TIMEOUT) as response:
+                    if response.status != 200:
+                        raise ValueError(f"status code {response.status}")
+                    if (response.content_length or 0) > MAX_IMAGE_BYTES:
+                        raise ValueError(f"{response.content_length} bytes is too large")
+                    original = await response.read()
+                digest = hashlib.blake2b(original, digest_size=16).hexdigest()
+                data = self.cache.get(digest)
+                if data is None:
+                    # Decoding and resizing is CPU-bound, keep it off the event loop
+                    data = await asyncio.to_thread(downscale, original, self.size)
+                    self.cache.put(digest, data)
+                    THUMBNAIL_STATS['fetched'] += 1
+                else:
+                    THUMBNAIL_STATS['hits'] += 1
+            except Exception as e:
+                # Thumbnails are best-effort, and PIL raises all sorts of errors on malformed images
+                THUMBNAIL_STATS['failed'] += 1
+                logger.debug("🖼️  No thumbnail for %s: %s", url, e)
+                return None
+            THUMBNAIL_SECONDS.observe(time.perf_counter() - start)
+
+        self._digests[url] = digest
+        self._digests.move_to_end(url)
+        while len(self._digests) > MAX_REMEMBERED_URLS:
+            self._digests.popitem(last=False)
+        return f"{digest}.jpg", data